@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Move old movements out of the hot ledger
+
+Movements older than the horizon are moved from ``movements`` to the
+zstd-compressed ``movements_archive`` collection. Their totals stay in
+movement_rollups, and exports, product history, the dashboard count and
+stock reconciliation keep reading the archive. Optionally each archived batch
+is also written as a Parquet file (needs pyarrow or fastparquet) for cold
+storage. The originals are deleted ARCHIVE_DELETE_GRACE_SECONDS after the copy
+completes, so reads already under way can finish, and the run waits that long.
+Safe to re-run after an interruption; meant to run nightly:
+
+    python backend/archive_movements.py --days 365
+    python backend/archive_movements.py --parquet-dir /backups/movements
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import pandas as pd
+import typer
+
+import server
+
+
+def parquet_writer(directory: str):
+    # Named after the batch's first movement, so a re-run after a crash overwrites its own file
+    os.makedirs(directory, exist_ok=True)
+
+    def write(batch):
+        first = batch[0]
+        path = os.path.join(directory, f"movements_{first['created_at']:%Y%m%dT%H%M%S}_{first['id'][:8]}.parquet")
+        frame = pd.DataFrame(batch).drop(columns=["_id"])
+        frame.to_parquet(path, compression="zstd", index=False)
+
+    return write
+
+
+def main(
+    days: int = typer.Option(server.ARCHIVE_HORIZON_DAYS, help="Archive movements older than this many days"),
+    parquet_dir: Optional[str] = typer.Option(None, help="Also write each archived batch as a Parquet file here"),
+):
+    on_batch = None
+    if parquet_dir:
+        try:
+            pd.io.parquet.get_engine("auto")
+        except ImportError:
+            typer.echo("--parquet-dir needs pyarrow or fastparquet installed", err=True)
+            raise typer.Exit(2)
+        on_batch = parquet_writer(parquet_dir)
+
+    async def run():
+        server.connect_mongo()
+        try:
+            await server.ensure_archive_collection()
+            await server.ensure_indexes()
+            horizon = datetime.now(timezone.utc) - timedelta(days=days)
+            return await server.archive_movements(horizon, on_batch=on_batch)
+        finally:
+            server.client.close()
+
+    result = asyncio.run(run())
+    typer.echo(f"Archived {result['archived']} movements; archive covers everything before {result['archived_before']:%Y-%m-%d %H:%M}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
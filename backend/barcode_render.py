@@ -0,0 +1,272 @@
+"""
+Barcode rendering for labels
+
+Pure-Python EAN-13, UPC-A and Code 128 encoders with SVG, PNG and PDF
+label-sheet writers, so label printing needs no imaging dependencies. All of
+it is synchronous and CPU-bound; server.py runs it in a worker pool.
+"""
+
+import struct
+import zlib
+from typing import List, Sequence, Tuple
+
+SYMBOLOGIES = ("EAN13", "UPC", "CODE128")
+
+# EAN/UPC digit patterns; R codes are the complement of L, G codes are R reversed
+EAN_L = ("0001101", "0011001", "0010011", "0111101", "0100011",
+         "0110001", "0101111", "0111011", "0110111", "0001011")
+EAN_R = tuple("".join("1" if bit == "0" else "0" for bit in code) for code in EAN_L)
+EAN_G = tuple(code[::-1] for code in EAN_R)
+# Left-half L/G parity that encodes the first EAN-13 digit
+EAN_PARITY = ("LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG",
+              "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL")
+
+# Code 128 bar/space widths for symbol values 0-106 (106 is the stop symbol)
+CODE128_WIDTHS = (
+    "212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312", "132212", "221213",
+    "221312", "231212", "112232", "122132", "122231", "113222", "123122", "123221", "223211", "221132",
+    "221231", "213212", "223112", "312131", "311222", "321122", "321221", "312212", "322112", "322211",
+    "212123", "212321", "232121", "111323", "131123", "131321", "112313", "132113", "132311", "211313",
+    "231113", "231311", "112133", "112331", "132131", "113123", "113321", "133121", "313121", "211331",
+    "231131", "213113", "213311", "213131", "311123", "311321", "331121", "312113", "312311", "332111",
+    "314111", "221411", "431111", "111224", "111422", "121124", "121421", "141122", "141221", "112214",
+    "112412", "122114", "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111",
+    "111242", "121142", "121241", "114212", "124112", "124211", "411212", "421112", "421211", "212141",
+    "214121", "412121", "111143", "111341", "131141", "114113", "114311", "411113", "411311", "113141",
+    "114131", "311141", "411131", "211412", "211214", "211232", "2331112",
+)
+CODE128_START = {"B": 104, "C": 105}
+CODE128_SWITCH = {"B": 100, "C": 99}
+CODE128_STOP = 106
+
+# Quiet zone on each side, in modules
+QUIET_ZONE = 10
+
+
+def gtin_check_digit(digits: str) -> str:
+    # GS1 mod-10: weights 3,1,3,... starting from the rightmost data digit
+    total = sum(int(digit) * (3 if index % 2 == 0 else 1) for index, digit in enumerate(reversed(digits)))
+    return str((10 - total % 10) % 10)
+
+
+def detect_symbology(code: str) -> str:
+    """EAN13/UPC for digit strings with a valid check digit, Code 128 otherwise."""
+    if code.isdigit() and code[-1] == gtin_check_digit(code[:-1]):
+        if len(code) == 13:
+            return "EAN13"
+        if len(code) == 12:
+            return "UPC"
+    return "CODE128"
+
+
+def encode_ean13(code: str) -> str:
+    if len(code) != 13 or not code.isdigit() or code[-1] != gtin_check_digit(code[:-1]):
+        raise ValueError("EAN-13 needs 13 digits with a valid check digit")
+    parity = EAN_PARITY[int(code[0])]
+    left = "".join((EAN_L if side == "L" else EAN_G)[int(digit)] for side, digit in zip(parity, code[1:7]))
+    right = "".join(EAN_R[int(digit)] for digit in code[7:])
+    return "101" + left + "01010" + right + "101"
+
+
+def encode_upc(code: str) -> str:
+    if len(code) != 12 or not code.isdigit():
+        raise ValueError("UPC-A needs 12 digits with a valid check digit")
+    # UPC-A is EAN-13 with a leading zero, whose parity is all L
+    return encode_ean13("0" + code)
+
+
+def code128_values(text: str) -> List[int]:
+    """Symbol values for ``text`` (start, data, checksum, stop).
+
+    Uses code set B, switching to code set C for runs of four or more digits
+    so numeric codes come out roughly half as wide.
+    """
+    if not text:
+        raise ValueError("Code 128 needs at least one character")
+    values = []
+    code_set = None
+
+    def use(target):
+        nonlocal code_set
+        if code_set != target:
+            values.append(CODE128_SWITCH[target] if values else CODE128_START[target])
+            code_set = target
+
+    index = 0
+    while index < len(text):
+        run = 0
+        while index + run < len(text) and text[index + run].isdigit():
+            run += 1
+        if run >= 4:
+            if run % 2:
+                use("B")
+                values.append(ord(text[index]) - 32)
+                index += 1
+                run -= 1
+            use("C")
+            values.extend(int(text[position:position + 2]) for position in range(index, index + run, 2))
+            index += run
+            continue
+        character = text[index]
+        if not 32 <= ord(character) <= 126:
+            raise ValueError("Code 128 only encodes printable ASCII")
+        use("B")
+        values.append(ord(character) - 32)
+        index += 1
+
+    checksum = (values[0] + sum(position * value for position, value in enumerate(values[1:], start=1))) % 103
+    return values + [checksum, CODE128_STOP]
+
+
+def encode_code128(text: str) -> str:
+    modules = []
+    for value in code128_values(text):
+        for position, width in enumerate(CODE128_WIDTHS[value]):
+            modules.append(("1" if position % 2 == 0 else "0") * int(width))
+    return "".join(modules)
+
+
+def encode(code: str, symbology: str) -> str:
+    """Module pattern for ``code``: "1" is a dark module, "0" a light one."""
+    if symbology == "EAN13":
+        return encode_ean13(code)
+    if symbology == "UPC":
+        return encode_upc(code)
+    if symbology == "CODE128":
+        return encode_code128(code)
+    raise ValueError(f"Unknown symbology {symbology}")
+
+
+def bar_runs(modules: str) -> List[Tuple[int, int]]:
+    """(start, width) of every dark bar, in modules."""
+    runs = []
+    start = None
+    for position, module in enumerate(modules + "0"):
+        if module == "1" and start is None:
+            start = position
+        elif module == "0" and start is not None:
+            runs.append((start, position - start))
+            start = None
+    return runs
+
+
+def xml_escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+def render_svg(code: str, symbology: str, module_width: int = 2, height: int = 80, show_text: bool = True) -> bytes:
+    modules = encode(code, symbology)
+    text_height = 14 if show_text else 0
+    width = (len(modules) + 2 * QUIET_ZONE) * module_width
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height + text_height}" '
+        f'viewBox="0 0 {width} {height + text_height}">',
+        f'<rect width="{width}" height="{height + text_height}" fill="#fff"/>',
+        '<path fill="#000" d="',
+    ]
+    parts.extend(
+        f"M{(QUIET_ZONE + start) * module_width} 0h{bar * module_width}v{height}h-{bar * module_width}z"
+        for start, bar in bar_runs(modules)
+    )
+    parts.append('"/>')
+    if show_text:
+        parts.append(
+            f'<text x="{width // 2}" y="{height + text_height - 2}" text-anchor="middle" '
+            f'font-family="monospace" font-size="12">{xml_escape(code)}</text>'
+        )
+    parts.append("</svg>")
+    return "".join(parts).encode()
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def render_png(code: str, symbology: str, module_width: int = 2, height: int = 80) -> bytes:
+    """8-bit grayscale PNG of the bars only (no human-readable text)."""
+    modules = "0" * QUIET_ZONE + encode(code, symbology) + "0" * QUIET_ZONE
+    row = b"\x00" + b"".join((b"\x00" if module == "1" else b"\xff") * module_width for module in modules)
+    header = struct.pack(">IIBBBBB", len(modules) * module_width, height, 8, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + png_chunk(b"IHDR", header)
+        + png_chunk(b"IDAT", zlib.compress(row * height, 9))
+        + png_chunk(b"IEND", b"")
+    )
+
+
+# A4 portrait in points; the default 3 x 8 grid matches common 70 x 37 mm label stock
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+LABEL_MARGIN = 6
+
+
+def pdf_text(text: str) -> str:
+    # Helvetica with WinAnsiEncoding covers Spanish accents; anything else becomes "?"
+    encoded = text.encode("cp1252", errors="replace").decode("latin-1")
+    return encoded.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def label_operations(title: str, code: str, symbology: str, x: float, y: float, width: float, height: float) -> List[str]:
+    """PDF drawing operators for one label whose lower-left corner is (x, y)."""
+    modules = encode(code, symbology)
+    inner = width - 2 * LABEL_MARGIN
+    module = inner / (len(modules) + 2 * QUIET_ZONE)
+    bars_bottom = y + LABEL_MARGIN + 10
+    bars_height = height - 2 * LABEL_MARGIN - 22
+    left = x + LABEL_MARGIN + QUIET_ZONE * module
+    operations = [
+        f"{left + start * module:.2f} {bars_bottom:.2f} {bar * module:.2f} {bars_height:.2f} re"
+        for start, bar in bar_runs(modules)
+    ]
+    operations.append("f")
+    # Truncate long names to what fits at 8pt (about 0.5em per character)
+    max_chars = int(inner / 4.2)
+    if len(title) > max_chars:
+        title = title[:max_chars - 1] + "…"
+    operations.append(f"BT /F1 8 Tf {x + LABEL_MARGIN:.2f} {y + height - LABEL_MARGIN - 8:.2f} Td ({pdf_text(title)}) Tj ET")
+    operations.append(f"BT /F1 8 Tf {x + width / 2 - len(code) * 2.2:.2f} {y + LABEL_MARGIN:.2f} Td ({pdf_text(code)}) Tj ET")
+    return operations
+
+
+def render_label_sheet(labels: Sequence[Tuple[str, str, str]], columns: int = 3, rows: int = 8) -> bytes:
+    """Paginated PDF of (title, code, symbology) labels laid out ``columns`` x ``rows`` per page."""
+    label_width = PAGE_WIDTH / columns
+    label_height = PAGE_HEIGHT / rows
+    per_page = columns * rows
+    pages = []
+    for first in range(0, len(labels), per_page):
+        operations = ["0 g"]
+        for offset, (title, code, symbology) in enumerate(labels[first:first + per_page]):
+            row, column = divmod(offset, columns)
+            x = column * label_width
+            y = PAGE_HEIGHT - (row + 1) * label_height
+            operations.extend(label_operations(title, code, symbology, x, y, label_width, label_height))
+        pages.append(zlib.compress("\n".join(operations).encode("latin-1")))
+    if not pages:
+        pages.append(zlib.compress(b""))
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content stream per page
+    page_ids = [4 + 2 * index for index in range(len(pages))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for page_id, content in zip(page_ids, pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode() + content + b"\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(output)
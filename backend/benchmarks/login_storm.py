@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Login storm benchmark
+
+Measures /api/health latency while N clients log in concurrently, to check
+that password hashing stays off the event loop. Runs the app in-process
+against MONGO_URL (a throwaway MONGO_DB_NAME is used unless one is set).
+
+    python backend/benchmarks/login_storm.py --concurrency 50 --rounds 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+os.environ.setdefault("MONGO_DB_NAME", "inventory_bench")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def probe(client, stop, samples):
+    """Hit the health endpoint back to back until ``stop`` is set."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/api/health")
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def measure(client, duration=None, workload=None):
+    samples = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(client, stop, samples))
+    if workload is None:
+        await asyncio.sleep(duration)
+    else:
+        await workload
+    stop.set()
+    await prober
+    return samples
+
+
+async def main(args):
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        usernames = []
+        for _ in range(args.concurrency):
+            username = f"bench-{uuid.uuid4().hex[:12]}"
+            response = await client.post("/api/auth/register", json={
+                "username": username,
+                "email": f"{username}@bench.local",
+                "password": "bench-password",
+                "full_name": "Benchmark User"
+            })
+            response.raise_for_status()
+            usernames.append(username)
+
+        async def storm():
+            for _ in range(args.rounds):
+                await asyncio.gather(*[
+                    client.post("/api/auth/login", json={"username": username, "password": "bench-password"})
+                    for username in usernames
+                ])
+
+        try:
+            idle = await measure(client, duration=2)
+            started = time.perf_counter()
+            busy = await measure(client, workload=storm())
+            elapsed = time.perf_counter() - started
+        finally:
+            await server.db.users.delete_many({"username": {"$in": usernames}})
+
+    logins = args.concurrency * args.rounds
+    print(f"Scheme: {server.PASSWORD_HASH_SCHEME} ({server.PASSWORD_HASH_EXECUTOR} pool, {server.PASSWORD_HASH_WORKERS} workers)")
+    print(f"Logins: {logins} in {elapsed:.2f}s ({logins / elapsed:.1f}/s)")
+    for label, samples in (("idle", idle), ("during storm", busy)):
+        print(f"/api/health {label:>12}: p50={statistics.median(samples):.2f}ms "
+              f"p99={percentile(samples, 99):.2f}ms n={len(samples)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for the inventory API
+
+Runs the FastAPI app in-process (httpx ASGI transport, lifespan included)
+against a local mongod, seeds a synthetic catalog into a throwaway database
+and drives scan / movement / dashboard / list / search workloads, reporting
+throughput and p50/p95/p99 latency per endpoint.
+
+    python backend/benchmarks/run.py --products 20000 --requests 2000 --concurrency 32 \\
+        --output bench.json --baseline previous.json
+
+Stock updates rely on pipeline updates and aggregations, so a real mongod is
+required (e.g. ``docker run -p 27017:27017 mongo:7``). The benchmark database
+(--db, default ``inventory_bench``; MONGO_DB_NAME is ignored) is dropped before
+seeding, and names without a bench prefix are refused unless --drop is given.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+
+WORKLOADS = ("scan", "movement", "dashboard", "list", "search")
+# Databases that may be dropped without --drop
+BENCH_DB_PREFIXES = ("bench", "inventory_bench")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def seed_catalog(count, user_id):
+    """Insert ``count`` synthetic products straight into the database."""
+    now = datetime.now(timezone.utc)
+    barcodes = []
+    batch = []
+    for index in range(count):
+        barcode = f"BENCH{index:08d}"
+        product = server.Product(
+            name=f"Producto {index:06d} {random.choice(['Caja', 'Tornillo', 'Cable', 'Panel', 'Filtro'])}",
+            description="Artículo sintético para benchmark",
+            barcode=barcode,
+            pieces_per_pallet=random.choice([None, 12, 24, 48]),
+            current_stock_pieces=random.randint(0, 500),
+            current_stock_pallets=random.randint(0, 20),
+            min_stock_alert=random.randint(0, 50),
+            price_per_piece=round(random.uniform(1, 200), 2),
+            category=f"Categoría {index % 40}",
+            created_at=now,
+            updated_at=now,
+            created_by=user_id,
+        )
+        document = product.dict()
+        document["low_stock"] = server.is_low_stock(document)
+        document["search_tokens"] = server.search_tokens(product.name)
+        batch.append(document)
+        barcodes.append((product.id, barcode))
+        if len(batch) >= 5000:
+            await server.db.products.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await server.db.products.insert_many(batch, ordered=False)
+    return barcodes
+
+
+def make_requests(catalog):
+    """One request factory per workload; each returns (method, url, json_body)."""
+    return {
+        "scan": lambda: ("GET", f"/api/products/barcode/{random.choice(catalog)[1]}", None),
+        "movement": lambda: ("POST", "/api/movements", {
+            "product_id": random.choice(catalog)[0],
+            "movement_type": random.choice(["entry", "exit"]),
+            "quantity_pieces": random.randint(1, 20),
+            "quantity_pallets": 0,
+            "movement_reason": "benchmark",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_by": "",
+            "user_name": "",
+        }),
+        "dashboard": lambda: ("GET", "/api/dashboard", None),
+        "list": lambda: ("GET", f"/api/products?limit=50&name_prefix=Producto%20{random.randint(0, 99):02d}", None),
+        "search": lambda: ("GET", f"/api/products/search?q={random.choice(['caj', 'tornillo', 'cable panel', 'filt'])}", None),
+    }
+
+
+async def drive(client, headers, factory, requests, concurrency):
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, body = factory()
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print p99/throughput deltas against a previous run; returns the regressed workloads."""
+    regressions = []
+    for name, current in results["workloads"].items():
+        previous = baseline.get("workloads", {}).get(name)
+        if not previous:
+            continue
+        p99_change = (current["p99_ms"] - previous["p99_ms"]) / previous["p99_ms"]
+        rps_change = (current["throughput_rps"] - previous["throughput_rps"]) / previous["throughput_rps"]
+        flag = ""
+        if p99_change > tolerance or rps_change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"  {name:<10} p99 {p99_change:+.1%}  throughput {rps_change:+.1%}{flag}")
+    return regressions
+
+
+async def main(args):
+    server.connect_mongo()
+    await server.client.drop_database(server.MONGO_DB_NAME)
+    server.client.close()
+
+    await server.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            username = f"bench-{uuid.uuid4().hex[:8]}"
+            response = await client.post("/api/auth/register", json={
+                "username": username,
+                "email": f"{username}@bench.local",
+                "password": "bench-password",
+                "full_name": "Benchmark User",
+            })
+            response.raise_for_status()
+            session = response.json()
+            headers = {"Authorization": f"Bearer {session['token']}"}
+
+            started = time.perf_counter()
+            catalog = await seed_catalog(args.products, session["user"]["id"])
+            print(f"Seeded {len(catalog)} products in {time.perf_counter() - started:.1f}s")
+
+            factories = make_requests(catalog)
+            selected = args.workloads
+            if args.mixed:
+                stats = await asyncio.gather(*[
+                    drive(client, headers, factories[name], args.requests, args.concurrency) for name in selected
+                ])
+                workloads = dict(zip(selected, stats))
+            else:
+                workloads = {}
+                for name in selected:
+                    workloads[name] = await drive(client, headers, factories[name], args.requests, args.concurrency)
+    finally:
+        await server.shutdown()
+
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "products": args.products,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "mixed": args.mixed,
+        "workloads": workloads,
+    }
+    for name, stats in workloads.items():
+        print(f"{name:<10} {stats['throughput_rps']:>9.1f} req/s  p50 {stats['p50_ms']:>8.2f}ms  "
+              f"p95 {stats['p95_ms']:>8.2f}ms  p99 {stats['p99_ms']:>8.2f}ms  errors {stats['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            print(f"Compared with {args.baseline}:")
+            if compare(results, json.load(baseline), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="inventory_bench", help="Database to seed; it is dropped first")
+    parser.add_argument("--drop", action="store_true", help="Allow dropping a --db without a bench prefix")
+    parser.add_argument("--products", type=int, default=10000, help="Synthetic catalog size")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per workload")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients per workload")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument("--mixed", action="store_true", help="Run the workloads at the same time")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed p99/throughput regression before exiting non-zero")
+    args = parser.parse_args()
+    if not args.db.startswith(BENCH_DB_PREFIXES) and not args.drop:
+        parser.error(f"refusing to drop database {args.db!r}; use a bench_* name or pass --drop")
+    # server reads the database name at import time
+    os.environ["MONGO_DB_NAME"] = args.db
+    import server  # noqa: E402
+    asyncio.run(main(args))
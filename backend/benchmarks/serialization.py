@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+List serialization benchmark
+
+Compares the per-item model path (build a model per document, then FastAPI's
+response_model validation and jsonable_encoder) with FastJSONResponse on
+already-projected documents. No database is needed.
+
+    python backend/benchmarks/serialization.py --sizes 1000 10000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import server  # noqa: E402
+
+
+def product_documents(count):
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Producto {index:06d}",
+            "description": "Artículo de prueba para el benchmark",
+            "barcode": f"{index:013d}",
+            "pieces_per_pallet": 24,
+            "current_stock_pieces": index % 500,
+            "current_stock_pallets": index % 20,
+            "min_stock_alert": 10,
+            "price_per_piece": 12.5,
+            "category": f"Categoría {index % 40}",
+            "created_at": now - timedelta(days=index % 365),
+            "updated_at": now,
+            "created_by": "benchmark",
+        }
+        for index in range(count)
+    ]
+
+
+async def model_path(documents, field):
+    content = [server.Product(**document) for document in documents]
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+async def fast_path(documents, field):
+    return server.FastJSONResponse(documents).body
+
+
+async def throughput(render, documents, field, repeat):
+    await render(documents, field)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await render(documents, field)
+    elapsed = (time.perf_counter() - started) / repeat
+    return elapsed * 1000, len(documents) / elapsed
+
+
+async def main(args):
+    field = create_response_field(name="response", type_=List[server.Product], mode="serialization")
+    encoder = "orjson" if server.orjson is not None else "json"
+    for size in args.sizes:
+        documents = product_documents(size)
+        repeat = max(3, 20000 // size)
+        before_ms, before_rate = await throughput(model_path, documents, field, repeat)
+        after_ms, after_rate = await throughput(fast_path, documents, field, repeat)
+        print(f"{size:>6} items  models: {before_ms:8.2f}ms ({before_rate:,.0f} items/s)  "
+              f"fast/{encoder}: {after_ms:7.2f}ms ({after_rate:,.0f} items/s)  x{before_ms / after_ms:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    asyncio.run(main(parser.parse_args()))
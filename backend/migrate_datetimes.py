@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Rewrite ISO-8601 date strings as native BSON datetimes
+
+Older versions of server.py stored created_at/updated_at as ISO strings.
+Date-range queries and created_at sorts only see native dates, so run this
+once after upgrading (it is safe to re-run and to run while the API serves):
+
+    python backend/migrate_datetimes.py --dry-run
+    python backend/migrate_datetimes.py
+"""
+
+import os
+from datetime import datetime, timezone
+
+import typer
+from pymongo import MongoClient, UpdateOne
+
+DATE_FIELDS = {
+    "users": ["created_at"],
+    "products": ["created_at", "updated_at"],
+    "movements": ["created_at"],
+}
+
+
+def parse_iso(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def main(
+    mongo_url: str = typer.Option(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), help="MongoDB URL"),
+    db_name: str = typer.Option(os.environ.get("MONGO_DB_NAME", "inventory_db"), help="Database name"),
+    batch_size: int = typer.Option(1000, help="Documents rewritten per bulk_write"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="Only count documents that need migrating"),
+):
+    db = MongoClient(mongo_url)[db_name]
+
+    for collection, fields in DATE_FIELDS.items():
+        for field in fields:
+            query = {field: {"$type": "string"}}
+            pending = db[collection].count_documents(query)
+            if dry_run or not pending:
+                typer.echo(f"{collection}.{field}: {pending} string dates")
+                continue
+
+            migrated = 0
+            failed = 0
+            operations = []
+            for document in db[collection].find(query, {field: 1}).batch_size(batch_size):
+                try:
+                    value = parse_iso(document[field])
+                except ValueError:
+                    failed += 1
+                    continue
+                # Matching on the old string keeps concurrent writers' values intact
+                operations.append(UpdateOne(
+                    {"_id": document["_id"], field: document[field]},
+                    {"$set": {field: value}}
+                ))
+                if len(operations) >= batch_size:
+                    migrated += db[collection].bulk_write(operations, ordered=False).modified_count
+                    operations = []
+            if operations:
+                migrated += db[collection].bulk_write(operations, ordered=False).modified_count
+
+            typer.echo(f"{collection}.{field}: migrated {migrated} of {pending}, {failed} unparseable")
+
+
+if __name__ == "__main__":
+    typer.run(main)
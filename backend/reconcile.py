@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Reconcile product stock with the movement ledger
+
+Replays every product's movements on top of its last verified balance (its
+opening stock the first time) and reports the products whose
+current_stock_pieces/pallets disagree; --repair writes the ledger values back. Runs are incremental from the last checkpoint unless
+--full is given, so a nightly job only looks at products with new movements:
+
+    python backend/reconcile.py
+    python backend/reconcile.py --full --repair
+
+Exits with status 1 when discrepancies were found and left unrepaired.
+"""
+
+import asyncio
+import json
+from typing import Optional
+
+import typer
+
+import server
+
+
+def main(
+    repair: bool = typer.Option(False, "--repair", help="Write the ledger balances back to the products"),
+    full: bool = typer.Option(False, "--full", help="Check every product instead of those with new movements"),
+    output: Optional[str] = typer.Option(None, help="Also write the report as JSON to this file"),
+):
+    async def run():
+        server.connect_mongo()
+        try:
+            return await server.reconcile_stock(repair=repair, full=full)
+        finally:
+            server.client.close()
+
+    report = asyncio.run(run())
+    summary = {key: value for key, value in report.items() if key != "items"}
+    for item in report["items"]:
+        typer.echo(
+            f"{item['product_id']}  {item['name']}: pieces {item['current_stock_pieces']} -> "
+            f"{item['expected_stock_pieces']}, pallets {item['current_stock_pallets']} -> {item['expected_stock_pallets']}"
+        )
+    typer.echo(json.dumps(summary, indent=2, default=str))
+    if output:
+        with open(output, "w") as handle:
+            json.dump(report, handle, indent=2, default=str)
+    if report["discrepancies"] and not repair:
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
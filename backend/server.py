@@ -1,16 +1,55 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, File, Header, Query, Request, Response, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from passlib.context import CryptContext
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure, PyMongoError
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from typing import List, Literal, Optional, Tuple
 from datetime import datetime, timezone, timedelta
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import os
+import time
+import asyncio
+import re
+import io
+import csv
+import gzip
 import uuid
+import json
+import base64
+import bisect
+import binascii
+import contextvars
 import jwt
 import hashlib
+import logging
+import signal
+import threading
+import unicodedata
 
-app = FastAPI()
+import barcode_render
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -21,18 +60,604 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB connection
-client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
-db = client.inventory_db
+# MongoDB connection, opened by connect_mongo() when the app starts
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+MONGO_DB_NAME = os.environ.get('MONGO_DB_NAME', 'inventory_db')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+# Optional client settings, passed through only when set
+MONGO_CLIENT_ENV_OPTIONS = {
+    'MONGO_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', int),
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', int),
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int),
+    'MONGO_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int),
+    'MONGO_SOCKET_TIMEOUT_MS': ('socketTimeoutMS', int),
+    'MONGO_READ_PREFERENCE': ('readPreference', str),
+    'MONGO_WRITE_CONCERN': ('w', lambda value: int(value) if value.isdigit() else value),
+}
+# Seconds to wait for in-flight requests before closing the client on shutdown
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', '10'))
+
+client = None
+db = None
+
+# Run the movement insert and its stock update in one transaction (requires a replica set)
+USE_TRANSACTIONS = os.environ.get('MONGO_TRANSACTIONS', 'false').lower() == 'true'
+# Without transactions a movement is inserted as pending and flagged once its stock change
+# is applied; a sweeper applies movements left pending by a crash. While a movement is in
+# flight its key sits on the product and rollup buckets so neither applies it twice. The
+# request holds a movement for the grace period, after which the sweeper may take it over.
+PENDING_MOVEMENT_GRACE_SECONDS = float(os.environ.get('PENDING_MOVEMENT_GRACE_SECONDS', '30'))
+PENDING_SWEEP_INTERVAL = float(os.environ.get('PENDING_SWEEP_INTERVAL', '60'))
+
+# Ledger archival: movements older than the horizon are moved to movements_archive
+# (zstd-compressed) by backend/archive_movements.py; reads that reach further back
+# than the archived horizon also consult the archive
+ARCHIVE_HORIZON_DAYS = int(os.environ.get('ARCHIVE_HORIZON_DAYS', '365'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '5000'))
+# How long archived rows stay in movements after the switch, for reads already under way
+ARCHIVE_DELETE_GRACE_SECONDS = float(os.environ.get('ARCHIVE_DELETE_GRACE_SECONDS', '600'))
+
+# Offline sync for scanner clients: deletions are remembered for this long (older
+# watermarks get a full resync), and changes younger than the settle window are held
+# back so writes committed slightly out of timestamp order are never skipped. That only
+# holds if every product write stamps updated_at when it runs (see stock_update())
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', '30'))
+SYNC_SETTLE_SECONDS = float(os.environ.get('SYNC_SETTLE_SECONDS', '5'))
+SYNC_PAGE_SIZE = 1000
+SYNC_PAGE_MAX_SIZE = 5000
+# Responses smaller than this are not worth compressing
+SYNC_GZIP_MIN_BYTES = 1024
+
+# Indexes backing every query path below, ensured on startup
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # Products without a barcode store "", so only non-empty codes must be unique
+        IndexModel([("barcode", ASCENDING)], unique=True, partialFilterExpression={"barcode": {"$gt": ""}}),
+        IndexModel([("name", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("category", ASCENDING), ("name", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("low_stock", ASCENDING), ("name", ASCENDING), ("id", ASCENDING)], partialFilterExpression={"low_stock": True}),
+        # Offline sync walks changes in (updated_at, id) order
+        IndexModel([("updated_at", ASCENDING), ("id", ASCENDING)]),
+        # Word-prefix autocomplete over normalized name tokens, and ranked full-text search
+        IndexModel([("search_tokens", ASCENDING)]),
+        IndexModel(
+            [("name", "text"), ("category", "text"), ("description", "text")],
+            weights={"name": 10, "category": 5, "description": 1},
+            default_language="spanish",
+            language_override="text_language",
+            name="product_text"
+        ),
+    ],
+    "movements": [
+        # Client-supplied ids and Idempotency-Keys make retried movements collide here
+        IndexModel([("id", ASCENDING)], unique=True),
+        # Movements whose stock change has not been applied yet, for the sweeper
+        IndexModel([("created_at", ASCENDING)], partialFilterExpression={"applied": False}, name="pending_movements"),
+        IndexModel([("product_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+    # Deleted products, kept long enough for offline clients to catch up
+    "product_tombstones": [
+        IndexModel([("deleted_at", ASCENDING)], expireAfterSeconds=SYNC_TOMBSTONE_RETENTION_DAYS * 86400),
+        IndexModel([("deleted_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    # Movements older than the archive horizon (see backend/archive_movements.py)
+    "movements_archive": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("product_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+    "movement_rollups": [
+        IndexModel([("product_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)], unique=True),
+        IndexModel([("granularity", ASCENDING), ("bucket", ASCENDING)]),
+    ],
+}
+
+# Per-product movement rollups maintained alongside every movement write
+ROLLUP_GRANULARITIES = ("hour", "day")
 
 # JWT Configuration
 JWT_SECRET = "your-secret-key-here-change-in-production"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Product listing
+PRODUCT_PAGE_SIZE = 50
+PRODUCT_PAGE_MAX_SIZE = 500
+
+# Bulk movement ingestion
+MOVEMENT_BULK_MAX_ITEMS = 10000
+
+# Idempotent movement writes: replayed responses are served from this cache when
+# possible, the unique index on movements.id is the durable guard
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+IDEMPOTENCY_CACHE_TTL = float(os.environ.get('IDEMPOTENCY_CACHE_TTL', '600'))
+# Movement ids derived from (user, Idempotency-Key)
+IDEMPOTENCY_NAMESPACE = uuid.UUID("6f1c2b9e-3d4a-4f5e-9a7b-8c0d1e2f3a4b")
+
+# Stock reconciliation against the movement ledger: products written to within the
+# settle window are left alone (a movement may still be in flight), and incremental
+# runs re-read this much history before the checkpoint
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', '500'))
+RECONCILE_SETTLE_SECONDS = float(os.environ.get('RECONCILE_SETTLE_SECONDS', '60'))
+RECONCILE_OVERLAP = timedelta(minutes=5)
+RECONCILE_REPORT_LIMIT = 1000
+# Usernames allowed to call the operator endpoints (comma separated); with none set
+# reconciliation only runs from backend/reconcile.py
+ADMIN_USERNAMES = frozenset(name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip())
+
+# Streaming exports: documents fetched per cursor batch and rows emitted per chunk
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+
+# Product search
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_WINDOW = 1000
+
+# Bulk product import: rows validated and upserted per batch
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+# Fields an import may overwrite on an existing product; stock only seeds new products
+IMPORT_CATALOG_FIELDS = ("name", "description", "pieces_per_pallet", "min_stock_alert", "price_per_piece", "category")
+# Fields a catalog edit (PUT/PATCH) may change
+CATALOG_FIELDS = IMPORT_CATALOG_FIELDS + ("barcode",)
+
+# Barcode generation: codes are numbered from per-format sequences in db.counters,
+# so concurrent requests never receive the same code. EAN13/UPC default to the
+# in-store GS1 prefixes (20-29 and 2) that never clash with manufacturer codes.
+BARCODE_EAN13_PREFIX = os.environ.get('BARCODE_EAN13_PREFIX', '20')
+BARCODE_UPC_PREFIX = os.environ.get('BARCODE_UPC_PREFIX', '2')
+BARCODE_CODE128_PREFIX = "INV"
+BARCODE_BATCH_MAX = 10000
+
+# Barcode images and label sheets: rendered in a worker pool (pure-Python, so processes
+# by default) and cached by content hash. Larger results are served but not cached.
+BARCODE_RENDER_EXECUTOR = os.environ.get('BARCODE_RENDER_EXECUTOR', 'process')  # or "thread"
+BARCODE_RENDER_WORKERS = int(os.environ.get('BARCODE_RENDER_WORKERS', '2'))
+BARCODE_RENDER_CACHE_SIZE = int(os.environ.get('BARCODE_RENDER_CACHE_SIZE', '2000'))
+BARCODE_RENDER_CACHE_TTL = float(os.environ.get('BARCODE_RENDER_CACHE_TTL', '86400'))
+BARCODE_RENDER_CACHE_MAX_BYTES = 1024 * 1024
+LABEL_SHEET_MAX_LABELS = 5000
+
+# Product lookup cache (by id and by barcode); size 0 disables it
+PRODUCT_CACHE_SIZE = int(os.environ.get('PRODUCT_CACHE_SIZE', '10000'))
+PRODUCT_CACHE_TTL = float(os.environ.get('PRODUCT_CACHE_TTL', '60'))
+# Invalidate through a change stream so several workers stay coherent (requires a replica set)
+PRODUCT_CACHE_CHANGE_STREAM = os.environ.get('PRODUCT_CACHE_CHANGE_STREAM', 'false').lower() == 'true'
+
+# Authentication caches: decoded tokens and recently verified active users.
+# Accounts are disabled directly in the database (there is no API for it), so
+# AUTH_USER_CACHE_TTL is the only bound on how long a disabled account keeps working.
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+AUTH_TOKEN_CACHE_TTL = float(os.environ.get('AUTH_TOKEN_CACHE_TTL', '300'))
+AUTH_USER_CACHE_TTL = float(os.environ.get('AUTH_USER_CACHE_TTL', '30'))
+
+# Password hashing: any passlib scheme, e.g. pbkdf2_sha256, scrypt, bcrypt or argon2
+# (the last two need the bcrypt / argon2-cffi backends installed). Hashing runs in a
+# bounded pool so a burst of logins never blocks the event loop.
+PASSWORD_HASH_SCHEME = os.environ.get('PASSWORD_HASH_SCHEME', 'pbkdf2_sha256')
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')  # or "process"
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+
+# Real-time stock events over SSE: per-subscriber queue bound (a subscriber that falls
+# this far behind is told to resync and disconnected) and keep-alive interval. With
+# EVENTS_CHANGE_STREAM the products change stream feeds the broker instead of the
+# writing endpoints, so every worker sees every write (requires a replica set).
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', '256'))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15'))
+EVENTS_CHANGE_STREAM = os.environ.get('EVENTS_CHANGE_STREAM', 'false').lower() == 'true'
+
+# Request metrics: latency buckets (seconds) and the slow-request log threshold (0 disables it)
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_DB_COMMAND_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '0'))
+
 # Security
 security = HTTPBearer()
 
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after ``ttl`` seconds."""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key, value, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else None
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Tracks connection pool usage and checkout wait times for the readiness probe.
+
+    Events arrive on Motor's executor threads; a checkout's start and end are
+    always reported by the same thread.
+    """
+    
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self.open_connections = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.checkout_failures = 0
+        self.wait_times_ms = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+    
+    def connection_checked_out(self, event):
+        waited_ms = (time.perf_counter() - getattr(self._local, "started", time.perf_counter())) * 1000
+        with self._lock:
+            self.waiting -= 1
+            self.checked_out += 1
+            self.wait_times_ms.append(waited_ms)
+    
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checkout_failures += 1
+    
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+    
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+    
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+    
+    def connection_ready(self, event):
+        pass
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        pass
+    
+    def pool_closed(self, event):
+        pass
+    
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self.wait_times_ms)
+            return {
+                "max_pool_size": self.max_pool_size,
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "saturation": round(self.checked_out / self.max_pool_size, 3) if self.max_pool_size else None,
+                "checkout_failures": self.checkout_failures,
+                "wait_ms_p50": round(waits[len(waits) // 2], 3) if waits else 0,
+                "wait_ms_p99": round(waits[int(len(waits) * 0.99)], 3) if waits else 0,
+                "wait_ms_max": round(waits[-1], 3) if waits else 0
+            }
+
+class RequestTracker:
+    """ASGI middleware counting in-flight HTTP requests so shutdown can drain them."""
+    
+    in_flight = 0
+    draining = False
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        RequestTracker.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            RequestTracker.in_flight -= 1
+    
+    @classmethod
+    async def drain(cls, timeout: float):
+        cls.draining = True
+        deadline = time.monotonic() + timeout
+        while cls.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if cls.in_flight:
+            logger.warning("Shutting down with %d requests still in flight", cls.in_flight)
+
+class EventSubscriber:
+    def __init__(self, product_ids: set, categories: set):
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.product_ids = product_ids
+        self.categories = categories
+    
+    def wants(self, event: dict) -> bool:
+        # Events without a product (resync, catalog imports) go to everyone
+        if "product_id" not in event:
+            return True
+        if self.product_ids and event["product_id"] not in self.product_ids:
+            return False
+        return not self.categories or event.get("category") in self.categories
+
+class EventBroker:
+    """In-process fan-out of stock and catalog events to SSE subscribers.
+
+    Publishing never waits: each subscriber has a bounded queue, and one that
+    falls behind is sent a final ``resync`` event and dropped, so a slow client
+    cannot hold memory or delay the others.
+    """
+    
+    def __init__(self):
+        self.subscribers = set()
+        self.published = 0
+        self.dropped = 0
+    
+    def subscribe(self, product_ids=(), categories=()) -> EventSubscriber:
+        subscriber = EventSubscriber(set(product_ids), set(categories))
+        self.subscribers.add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber: EventSubscriber):
+        self.subscribers.discard(subscriber)
+    
+    def publish(self, event: dict):
+        self.published += 1
+        for subscriber in list(self.subscribers):
+            if not subscriber.wants(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.disconnect(subscriber, {"type": "resync", "reason": "slow_consumer"})
+                self.dropped += 1
+    
+    def disconnect(self, subscriber: EventSubscriber, final_event: dict):
+        # Replace whatever is queued with the final event followed by the end-of-stream marker
+        self.subscribers.discard(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(final_event)
+        subscriber.queue.put_nowait(None)
+    
+    def close(self):
+        for subscriber in list(self.subscribers):
+            self.disconnect(subscriber, {"type": "resync", "reason": "shutdown"})
+
+class Histogram:
+    """Prometheus-style histogram keyed by label values."""
+    
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = defaultdict(lambda: [[0] * (len(buckets) + 1), 0.0])
+        self._lock = threading.Lock()
+    
+    def observe(self, label_values: tuple, value: float):
+        with self._lock:
+            counts, _ = series = self._series[label_values]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(label_values, list(counts), total) for label_values, (counts, total) in self._series.items()]
+        for label_values, counts, total in sorted(series):
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+class RequestDBStats:
+    __slots__ = ("commands", "seconds", "pending", "shapes")
+    
+    def __init__(self):
+        self.commands = 0
+        self.seconds = 0.0
+        self.pending = {}
+        self.shapes = []
+
+# Database work done on behalf of the current request; Motor copies the context
+# into its executor threads, so the command listener sees the request's object
+request_db_stats = contextvars.ContextVar("request_db_stats", default=None)
+
+def query_shape(value):
+    # Keep keys and operators, drop the values: {"id": {"$in": ["a", "b"]}} -> {"id": {"$in": ["?"]}}
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(value[0])] if value else []
+    return "?"
+
+def command_shape(command_name: str, command: dict) -> dict:
+    shape = {"command": command_name, "collection": command.get(command_name)}
+    for key in ("filter", "pipeline", "sort"):
+        if key in command:
+            shape[key] = query_shape(command[key])
+    for key in ("updates", "deletes"):
+        if command.get(key):
+            shape["filter"] = query_shape(command[key][0].get("q"))
+    return shape
+
+class CommandMonitor(monitoring.CommandListener):
+    """Times every MongoDB command, globally and per request."""
+    
+    def started(self, event):
+        stats = request_db_stats.get()
+        if stats is not None and SLOW_REQUEST_MS > 0:
+            stats.pending[event.request_id] = command_shape(event.command_name, event.command)
+    
+    def succeeded(self, event):
+        self._finish(event, "ok")
+    
+    def failed(self, event):
+        self._finish(event, "error")
+    
+    def _finish(self, event, outcome: str):
+        seconds = event.duration_micros / 1_000_000
+        metrics["db_command_seconds"].observe((event.command_name, outcome), seconds)
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats.commands += 1
+            stats.seconds += seconds
+            shape = stats.pending.pop(event.request_id, None)
+            if shape is not None:
+                stats.shapes.append({**shape, "ms": round(seconds * 1000, 3)})
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and database usage."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        status_code = 500
+        
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        stats = RequestDBStats()
+        token = request_db_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_db_stats.reset(token)
+            route = scope.get("route")
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            metrics["request_seconds"].observe(labels + (str(status_code),), elapsed)
+            metrics["request_db_commands"].observe(labels, stats.commands)
+            metrics["request_db_seconds"].observe(labels, stats.seconds)
+            if SLOW_REQUEST_MS > 0 and elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request %s %s: %.1fms, %d db commands in %.1fms %s",
+                    labels[0], labels[1], elapsed * 1000, stats.commands, stats.seconds * 1000,
+                    json.dumps(stats.shapes, default=str)
+                )
+
+metrics = {
+    "request_seconds": Histogram(
+        "http_request_duration_seconds", "Request latency by route",
+        ("method", "route", "status"), METRICS_LATENCY_BUCKETS
+    ),
+    "request_db_commands": Histogram(
+        "http_request_db_commands", "MongoDB commands issued per request",
+        ("method", "route"), METRICS_DB_COMMAND_BUCKETS
+    ),
+    "request_db_seconds": Histogram(
+        "http_request_db_duration_seconds", "Time spent in MongoDB commands per request",
+        ("method", "route"), METRICS_LATENCY_BUCKETS
+    ),
+    "db_command_seconds": Histogram(
+        "mongodb_command_duration_seconds", "MongoDB command latency",
+        ("command", "outcome"), METRICS_LATENCY_BUCKETS
+    ),
+}
+
+pool_monitor = PoolMonitor(MONGO_MAX_POOL_SIZE)
+command_monitor = CommandMonitor()
+
+app.add_middleware(RequestTracker)
+app.add_middleware(MetricsMiddleware)
+
+# ("id", product_id) -> Product, ("barcode", barcode) -> product_id
+product_cache = TTLCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL)
+
+# sha256(token) -> decoded payload, user_id -> True while the account is active
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_TOKEN_CACHE_TTL)
+active_user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_USER_CACHE_TTL)
+
+# Legacy unsalted SHA-256 hex digests still verify and are rehashed on the next login
+pwd_context = CryptContext(schemes=[PASSWORD_HASH_SCHEME, "hex_sha256"], deprecated=["hex_sha256"])
+password_executor = (ProcessPoolExecutor if PASSWORD_HASH_EXECUTOR == "process" else ThreadPoolExecutor)(
+    max_workers=PASSWORD_HASH_WORKERS
+)
+
+# sha256 of the render parameters -> rendered bytes
+render_cache = TTLCache(BARCODE_RENDER_CACHE_SIZE, BARCODE_RENDER_CACHE_TTL)
+render_executor = (ProcessPoolExecutor if BARCODE_RENDER_EXECUTOR == "process" else ThreadPoolExecutor)(
+    max_workers=BARCODE_RENDER_WORKERS
+)
+
+event_broker = EventBroker()
+
+# movement id -> movement dict, for answering retries without a database lookup
+idempotency_cache = TTLCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_CACHE_TTL)
+
+# Long-running tasks started on startup (change stream watchers)
+background_tasks = []
+
+# Signal handlers replaced on startup, restored on shutdown
+previous_signal_handlers = {}
+
 # Pydantic models
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -75,6 +700,19 @@ class Product(BaseModel):
     created_at: datetime
     updated_at: datetime
     created_by: str  # user_id
+    version: int = 0  # bumped by every catalog edit, exposed as the ETag
+
+class ProductPatch(BaseModel):
+    # Stock is only changed through movements, so it cannot be patched
+    model_config = ConfigDict(extra="forbid")
+    
+    name: Optional[str] = None
+    description: Optional[str] = None
+    barcode: Optional[str] = None
+    pieces_per_pallet: Optional[int] = None
+    min_stock_alert: Optional[int] = None
+    price_per_piece: Optional[float] = None
+    category: Optional[str] = None
 
 class InventoryMovement(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -88,12 +726,58 @@ class InventoryMovement(BaseModel):
     created_by: str  # user_id
     user_name: str   # username for display
 
+class BulkMovementItem(BaseModel):
+    id: Optional[str] = None  # client-generated, makes retrying the batch safe
+    product_id: str
+    movement_type: Literal["entry", "exit"]
+    quantity_pieces: int = Field(ge=0)
+    quantity_pallets: int = Field(0, ge=0)
+    movement_reason: Optional[str] = ""
+    barcode_scanned: Optional[str] = ""
+
+class BulkMovementResult(BaseModel):
+    index: int
+    status: str  # "created", "duplicate" (already recorded by an earlier request) or "error"
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkMovementResponse(BaseModel):
+    created: int
+    duplicates: int = 0
+    failed: int
+    results: List[BulkMovementResult]
+
+class BarcodeBatchRequest(BaseModel):
+    format: Literal["EAN13", "UPC", "CODE128"] = "EAN13"
+    count: int = Field(ge=1, le=BARCODE_BATCH_MAX)
+
+class LabelSheetRequest(BaseModel):
+    product_ids: List[str] = Field(min_length=1)
+    copies: int = Field(1, ge=1, le=100)
+    columns: int = Field(3, ge=1, le=6)
+    rows: int = Field(8, ge=1, le=20)
+
+class ProductPage(BaseModel):
+    items: List[dict]
+    next_cursor: Optional[str] = None
+
 # Helper functions
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+def _hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    try:
+        return pwd_context.verify_and_update(password, password_hash)
+    except ValueError:
+        # Unrecognized hash format
+        return False, None
 
-def verify_password(password: str, password_hash: str) -> bool:
-    return hash_password(password) == password_hash
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, _hash_password, password)
+
+async def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """Check ``password``; also returns a replacement hash when the stored one is outdated."""
+    return await asyncio.get_running_loop().run_in_executor(password_executor, _verify_password, password, password_hash)
 
 def create_access_token(user_id: str, username: str) -> str:
     expiration = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
@@ -104,42 +788,1123 @@ def create_access_token(user_id: str, username: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def decode_token(token: str) -> dict:
+    token_key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(token_key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        # Never keep a token cached past its own expiration
+        ttl = min(AUTH_TOKEN_CACHE_TTL, payload.get("exp", 0) - time.time())
+        if ttl > 0:
+            token_cache.set(token_key, payload, ttl=ttl)
+    return payload
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await authenticate_token(credentials.credentials)
+
+async def get_event_stream_user(request: Request, access_token: Optional[str] = None):
+    # EventSource cannot send headers, so browsers pass the token as ?access_token=
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    token = token if scheme.lower() == "bearer" and token else access_token
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await authenticate_token(token)
+
+async def authenticate_token(token: str) -> dict:
+    payload = decode_token(token)
+    user_id = payload.get("user_id")
+    username = payload.get("username")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    # Verify user exists, at most once per AUTH_USER_CACHE_TTL
+    if active_user_cache.get(user_id) is None:
+        user = await db.users.find_one({"id": user_id}, {"_id": 0, "is_active": 1})
+        if not user or not user.get("is_active"):
+            raise HTTPException(status_code=401, detail="User not found or inactive")
+        active_user_cache.set(user_id, True)
+    
+    return {"user_id": user_id, "username": username}
+
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user.get("username") not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+# Fields read back for list endpoints; anything else stored on the documents is internal
+PRODUCT_PROJECTION = {"_id": 0, **{name: 1 for name in Product.model_fields}}
+MOVEMENT_PROJECTION = {"_id": 0, **{name: 1 for name in InventoryMovement.model_fields}}
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """JSON response for trusted, already-projected database documents.
+
+    List endpoints return their documents through this class directly, which
+    skips building a model per item and FastAPI's response_model validation.
+    """
+    
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def mongo_datetime(value: datetime):
+    # Naive datetimes in queries are taken as UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def created_at_range(start: Optional[datetime], end: Optional[datetime]) -> dict:
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = mongo_datetime(start)
+    if end is not None:
+        bounds["$lt"] = mongo_datetime(end)
+    return {"created_at": bounds} if bounds else {}
+
+async def stream_export(cursor, fields: List[str], format: str):
+    """Render a Motor cursor as CSV or NDJSON, one chunk per EXPORT_BATCH_SIZE rows."""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        rows = 0
+        async for document in cursor:
+            writer.writerow({
+                key: value.isoformat() if isinstance(value, datetime) else value
+                for key, value in document.items()
+            })
+            rows += 1
+            if rows % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+    else:
+        lines = []
+        async for document in cursor:
+            lines.append(json.dumps(document, default=json_default, ensure_ascii=False))
+            if len(lines) >= EXPORT_BATCH_SIZE:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+def export_response(cursor, fields: List[str], format: str, name: str) -> StreamingResponse:
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_export(cursor, fields, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'}
+    )
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int = 2) -> list:
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        username = payload.get("username")
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    # Only plain strings, so a crafted cursor cannot smuggle query operators in
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(value, str) for value in values):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return values
+
+def product_projection(fields: Optional[str] = None) -> dict:
+    # The sort key (name, id) is always projected so the next cursor can be built
+    if not fields:
+        return PRODUCT_PROJECTION
+    projection = {"_id": 0, "id": 1, "name": 1}
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in Product.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(unknown)}")
+    projection.update({name: 1 for name in requested})
+    return projection
+
+# Products carry a materialized ``low_stock`` flag, recomputed by every write that
+# touches stock or the alert threshold, so the dashboard never has to scan the catalog
+LOW_STOCK_STAGE = {"$set": {"low_stock": {"$lte": ["$current_stock_pieces", {"$ifNull": ["$min_stock_alert", 0]}]}}}
+
+def search_tokens(text: Optional[str]) -> List[str]:
+    # Lowercased, accent-free words, e.g. "Cámara Réflex" -> ["camara", "reflex"]
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+    return list(dict.fromkeys(re.findall(r"\w+", folded)))
+
+def is_low_stock(product: dict) -> bool:
+    return product.get("current_stock_pieces", 0) <= (product.get("min_stock_alert") or 0)
+
+def stock_update(pieces_delta: int, pallets_delta: int, apply_key: Optional[str] = None) -> list:
+    # Pipeline update: an atomic server-side increment floored at zero, so
+    # concurrent movements on the same product can never lose each other's changes.
+    # updated_at is the server's clock at write time (never moved back), which the
+    # /api/sync watermark relies on.
+    # ``apply_key`` (a movement or bulk batch id) is remembered on the product until
+    # finish_movements(); pair this with the applied_filter() guard so a key is
+    # applied at most once.
+    stage = {
+        "current_stock_pieces": {"$max": [0, {"$add": [{"$ifNull": ["$current_stock_pieces", 0]}, pieces_delta]}]},
+        "current_stock_pallets": {"$max": [0, {"$add": [{"$ifNull": ["$current_stock_pallets", 0]}, pallets_delta]}]},
+        "updated_at": {"$max": ["$$NOW", "$updated_at"]}
+    }
+    if apply_key is not None:
+        stage["applied_movements"] = {"$concatArrays": [{"$ifNull": ["$applied_movements", []]}, [apply_key]]}
+    return [{"$set": stage}, LOW_STOCK_STAGE]
+
+def applied_filter(product_id: str, apply_key: Optional[str] = None) -> dict:
+    if apply_key is None:
+        return {"id": product_id}
+    return {"id": product_id, "applied_movements": {"$ne": apply_key}}
+
+class MovementHandedOver(Exception):
+    """A writer ran past its hold on pending movements; the sweeper finishes them."""
+
+def check_hold(deadline: datetime):
+    # Stop with a margin: once the deadline passes the sweeper may take the movements over
+    if datetime.now(timezone.utc) > deadline - timedelta(seconds=PENDING_MOVEMENT_GRACE_SECONDS / 2):
+        raise MovementHandedOver()
+
+async def finish_movements(apply_key: str, movement_filter: dict, product_ids: List[str]):
+    """Flag pending movements applied, then drop their key from the products and rollup buckets.
+
+    A crash between the two steps leaves the key behind, which only costs its bytes.
+    """
+    await db.movements.update_many(movement_filter, {"$set": {"applied": True}, "$unset": {"claimed_until": ""}})
+    await db.products.update_many(
+        {"id": {"$in": product_ids}, "applied_movements": apply_key}, {"$pull": {"applied_movements": apply_key}})
+    await db.movement_rollups.update_many(
+        {"product_id": {"$in": product_ids}, "applied_movements": apply_key}, {"$pull": {"applied_movements": apply_key}})
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    value = mongo_datetime(value).astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == "day" else value
+
+def rollup_counts(movement_type: str, pieces: int, pallets: int) -> dict:
+    kind, sign = ("entries", 1) if movement_type == "entry" else ("exits", -1)
+    return {
+        "movements": 1,
+        f"{kind}_pieces": pieces,
+        f"{kind}_pallets": pallets,
+        "net_pieces": sign * pieces,
+        "net_pallets": sign * pallets
+    }
+
+def rollup_operations(
+    product_id: str, at: datetime, counts: dict, product: Optional[dict], apply_key: Optional[str] = None
+) -> list:
+    """Upserts adding ``counts`` to the product's hour and day buckets containing ``at``.
+
+    ``product`` is the product document after the movement; its stock becomes
+    the bucket's ending balance unless a later movement already wrote one, since
+    concurrent movements can finish out of order. With ``apply_key`` a bucket
+    that already counted the key is left alone (see write_rollups()).
+    """
+    # One pipeline stage, so every expression sees the bucket as it was before this update
+    stage = {key: {"$add": [{"$ifNull": [f"${key}", 0]}, value]} for key, value in counts.items()}
+    stage["last_movement_at"] = {"$max": ["$last_movement_at", at]}
+    if product:
+        latest = {"$gte": [at, {"$ifNull": ["$last_movement_at", at]}]}
+        stage["ending_pieces"] = {"$cond": [latest, product.get("current_stock_pieces", 0), "$ending_pieces"]}
+        stage["ending_pallets"] = {"$cond": [latest, product.get("current_stock_pallets", 0), "$ending_pallets"]}
+    guard = {}
+    if apply_key is not None:
+        stage["applied_movements"] = {"$concatArrays": [{"$ifNull": ["$applied_movements", []]}, [apply_key]]}
+        guard = {"applied_movements": {"$ne": apply_key}}
+    return [
+        UpdateOne(
+            {"product_id": product_id, "granularity": granularity, "bucket": bucket_start(at, granularity), **guard},
+            [{"$set": stage}],
+            upsert=True
+        )
+        for granularity in ROLLUP_GRANULARITIES
+    ]
+
+async def write_rollups(operations: list, session=None):
+    if not operations:
+        return
+    try:
+        await db.movement_rollups.bulk_write(operations, ordered=False, session=session)
+    except BulkWriteError as e:
+        # A guarded upsert hits the unique bucket index when the bucket already counted its key
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+async def apply_movement(movement: InventoryMovement) -> Optional[dict]:
+    """Record ``movement`` and apply it to its product's stock.
+
+    Returns the updated product document, or ``None`` if the product does not exist.
+    The movement is inserted first, so a movement whose id was already recorded
+    raises ``DuplicateKeyError`` before any stock changes. Without transactions it
+    is inserted as pending and flagged once applied, see apply_pending_movements();
+    ``MovementHandedOver`` means the request stalled and the sweeper will finish it.
+    """
+    sign = 1 if movement.movement_type == "entry" else -1
+    counts = rollup_counts(movement.movement_type, movement.quantity_pieces, movement.quantity_pallets)
+    deadline = movement.created_at + timedelta(seconds=PENDING_MOVEMENT_GRACE_SECONDS)
+    
+    async def write(session=None):
+        apply_key = None if session is not None else movement.id
+        await db.movements.insert_one({**movement.dict(), "applied": session is not None}, session=session)
+        if session is None:
+            check_hold(deadline)
+        product = await db.products.find_one_and_update(
+            applied_filter(movement.product_id, apply_key),
+            stock_update(sign * movement.quantity_pieces, sign * movement.quantity_pallets, apply_key),
+            projection={"_id": 0, "applied_movements": 0},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if not product and session is None:
+            # Blocked by the guard: the sweeper already applied this key
+            product = await db.products.find_one({"id": movement.product_id}, {"_id": 0, "applied_movements": 0})
+        if not product:
+            await db.movements.delete_one({"id": movement.id, "applied": session is not None}, session=session)
+            return None
+        if session is None:
+            check_hold(deadline)
+        await write_rollups(
+            rollup_operations(movement.product_id, movement.created_at, counts, product, apply_key), session=session)
+        if session is None:
+            check_hold(deadline)
+            await finish_movements(movement.id, {"id": movement.id}, [movement.product_id])
+        return product
+    
+    if not USE_TRANSACTIONS:
+        return await write()
+    async with await client.start_session() as session:
+        return await session.with_transaction(write)
+
+async def apply_pending_movements() -> int:
+    """Apply the stock change of movements left pending by an interrupted request.
+
+    Movements are grouped by the key they were applied under (the movement id,
+    or the batch id for bulk uploads). Each group is claimed first, so sweepers
+    in other workers leave it alone, and the applied_filter()/write_rollups()
+    guards skip the products and buckets that already got the key before the
+    request died.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=PENDING_MOVEMENT_GRACE_SECONDS)
+    pending = await db.movements.find(
+        {"applied": False, "created_at": {"$lt": cutoff}}, {"_id": 0, "id": 1, "batch_id": 1, "created_at": 1}) \
+        .sort("created_at", 1) \
+        .limit(IMPORT_BATCH_SIZE) \
+        .to_list(length=IMPORT_BATCH_SIZE)
+    groups = {}
+    for movement in pending:
+        # A bulk batch shares one created_at, so this finds all of it in the pending index
+        field = "batch_id" if movement.get("batch_id") else "id"
+        groups[movement[field]] = {"applied": False, "created_at": movement["created_at"], field: movement[field]}
+    
+    applied = 0
+    for apply_key, movement_filter in groups.items():
+        try:
+            applied += await apply_pending_group(apply_key, movement_filter)
+        except MovementHandedOver:
+            logger.warning("Sweep of pending movements %s ran past its claim, retrying later", apply_key)
+    if applied:
+        logger.warning("Applied %d movements left pending by interrupted requests", applied)
+    return applied
+
+async def apply_pending_group(apply_key: str, movement_filter: dict) -> int:
+    now = datetime.now(timezone.utc)
+    deadline = now + timedelta(seconds=PENDING_MOVEMENT_GRACE_SECONDS)
+    movements = await db.movements.find(movement_filter).to_list(length=None)
+    claimed = await db.movements.update_many(
+        {**movement_filter, "$or": [{"claimed_until": {"$exists": False}}, {"claimed_until": {"$lt": now}}]},
+        {"$set": {"claimed_until": deadline}}
+    )
+    if not movements or claimed.modified_count < len(movements):
+        return 0
+    
+    deltas = {}
+    rollups = {}
+    for movement in movements:
+        sign = 1 if movement["movement_type"] == "entry" else -1
+        pieces, pallets = deltas.get(movement["product_id"], (0, 0))
+        deltas[movement["product_id"]] = (
+            pieces + sign * movement["quantity_pieces"], pallets + sign * movement["quantity_pallets"])
+        counts = rollups.setdefault(movement["product_id"], {})
+        for key, value in rollup_counts(
+                movement["movement_type"], movement["quantity_pieces"], movement["quantity_pallets"]).items():
+            counts[key] = counts.get(key, 0) + value
+    at = movements[0]["created_at"]
+    balances = {}
+    for product_id, (pieces, pallets) in deltas.items():
+        check_hold(deadline)
+        product = await db.products.find_one_and_update(
+            applied_filter(product_id, apply_key),
+            stock_update(pieces, pallets, apply_key),
+            projection={"_id": 0, "applied_movements": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if product:
+            invalidate_product(product_id)
+            publish_stock_change(product, pieces, pallets)
+        else:
+            # Applied before the request died, or the product is gone
+            product = await db.products.find_one({"id": product_id}, {"_id": 0, "applied_movements": 0})
+        if product:
+            balances[product_id] = product
+    check_hold(deadline)
+    await write_rollups([
+        operation
+        for product_id, product in balances.items()
+        for operation in rollup_operations(product_id, at, rollups[product_id], product, apply_key)
+    ])
+    check_hold(deadline)
+    await finish_movements(apply_key, {"id": {"$in": [movement["id"] for movement in movements]}}, list(deltas))
+    return len(movements)
+
+async def drop_stale_apply_keys():
+    # Products used to keep their last 100 apply keys; only keys still in flight are needed
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=PENDING_MOVEMENT_GRACE_SECONDS)
+    pending = set()
+    async for movement in db.movements.find({"applied": False}, {"_id": 0, "id": 1, "batch_id": 1}):
+        pending.add(movement.get("batch_id") or movement["id"])
+    await db.products.update_many(
+        {"applied_movements.0": {"$exists": True}, "updated_at": {"$lt": cutoff}},
+        {"$pull": {"applied_movements": {"$nin": list(pending)}}}
+    )
+
+async def sweep_pending_movements():
+    while True:
+        try:
+            await apply_pending_movements()
+        except PyMongoError as e:
+            logger.error("Pending movement sweep failed: %s", e)
+        await asyncio.sleep(PENDING_SWEEP_INTERVAL)
+
+def opening_stock(product_dict: dict) -> dict:
+    # Stock a product starts with; reconciliation replays movements on top of it
+    return {
+        "opening_stock_pieces": product_dict["current_stock_pieces"],
+        "opening_stock_pallets": product_dict["current_stock_pallets"],
+        "opening_at": product_dict["created_at"]
+    }
+
+def signed_quantity(field: str) -> dict:
+    return {"$cond": [{"$eq": ["$movement_type", "exit"]}, {"$multiply": [-1, f"${field}"]}, f"${field}"]}
+
+async def ledger_balances(products: List[dict], cutoff: datetime) -> dict:
+    """product id -> (pieces, pallets) replayed from the ledger up to ``cutoff``.
+
+    Each replay starts from the product's last verified balance in
+    reconciliation_balances, or from its opening stock, so only the movements
+    since then are read. Steps are folded here as they stream in, so no single
+    document has to hold a product's history.
+    """
+    starts = {}
+    async for balance in db.reconciliation_balances.find({"_id": {"$in": [product["id"] for product in products]}}):
+        starts[balance["_id"]] = (balance["at"], balance["pieces"], balance["pallets"])
+    for product in products:
+        if product["id"] not in starts and "opening_at" in product:
+            starts[product["id"]] = (
+                product["opening_at"], product.get("opening_stock_pieces", 0), product.get("opening_stock_pallets", 0))
+    balances = {product_id: (pieces, pallets) for product_id, (_, pieces, pallets) in starts.items()}
+    if not starts:
+        return balances
+    
+    # Pending movements are not in the stock yet; the sweeper adds them on top of any repair
+    match = {
+        "product_id": {"$in": list(starts)},
+        "created_at": {"$gte": min(at for at, _, _ in starts.values()), "$lt": cutoff},
+        "applied": {"$ne": False}
+    }
+    horizon = await archived_before()
+    if horizon is None:
+        pipeline = [{"$match": match}]
+    else:
+        # Archived history still counts; each row is read from exactly one side of the horizon
+        since = match["created_at"]["$gte"]
+        pipeline = [
+            {"$match": {**match, "created_at": {"$gte": max(since, horizon), "$lt": cutoff}}},
+            {"$unionWith": {"coll": "movements_archive", "pipeline": [
+                {"$match": {**match, "created_at": {"$gte": since, "$lt": min(cutoff, horizon)}}}
+            ]}}
+        ]
+    pipeline += [
+        {"$group": {
+            "_id": {"product_id": "$product_id", "at": "$created_at"},
+            "pieces": {"$sum": signed_quantity("quantity_pieces")},
+            "pallets": {"$sum": signed_quantity("quantity_pallets")}
+        }},
+        {"$sort": {"_id.product_id": 1, "_id.at": 1}}
+    ]
+    async for step in db.movements.aggregate(pipeline, allowDiskUse=True):
+        product_id, at = step["_id"]["product_id"], step["_id"]["at"]
+        if at < starts[product_id][0]:
+            continue
+        # Applies the zero floor per step like stock_update does; a bulk upload shares
+        # one created_at per batch, so each step is one movement or one batch
+        pieces, pallets = balances[product_id]
+        balances[product_id] = (max(0, pieces + step["pieces"]), max(0, pallets + step["pallets"]))
+    return balances
+
+def balance_checkpoint(product_id: str, pieces: int, pallets: int, cutoff: datetime) -> UpdateOne:
+    return UpdateOne({"_id": product_id}, {"$set": {"pieces": pieces, "pallets": pallets, "at": cutoff}}, upsert=True)
+
+async def reconcile_batch(product_ids: List[str], cutoff: datetime, repair: bool, report: dict) -> List[str]:
+    """Check one batch of products and return the ids skipped as busy."""
+    products = await db.products.find(
+        {"id": {"$in": product_ids}},
+        {"_id": 0, "id": 1, "name": 1, "current_stock_pieces": 1, "current_stock_pallets": 1,
+         "opening_stock_pieces": 1, "opening_stock_pallets": 1, "opening_at": 1, "updated_at": 1}
+    ).to_list(length=None)
+    balances = await ledger_balances(products, cutoff)
+    # A pending movement lands in the stock later, after its product's balance would be verified
+    pending = set(await db.movements.distinct("product_id", {"applied": False, "product_id": {"$in": product_ids}}))
+    
+    busy = []
+    baselines = []
+    checkpoints = []
+    operations = []
+    repairs = []
+    for product in products:
+        report["checked"] += 1
+        observed = {
+            "id": product["id"],
+            "current_stock_pieces": product.get("current_stock_pieces", 0),
+            "current_stock_pallets": product.get("current_stock_pallets", 0),
+            "updated_at": product.get("updated_at")
+        }
+        if (isinstance(product.get("updated_at"), datetime) and product["updated_at"] >= cutoff) or product["id"] in pending:
+            report["busy"] += 1
+            busy.append(product["id"])
+            continue
+        if "opening_at" not in product:
+            # Created before opening stock was recorded: today's stock becomes the baseline
+            report["unbaselined"] += 1
+            if repair:
+                baselines.append(UpdateOne({**observed, "opening_at": {"$exists": False}}, {"$set": {
+                    "opening_stock_pieces": observed["current_stock_pieces"],
+                    "opening_stock_pallets": observed["current_stock_pallets"],
+                    "opening_at": cutoff
+                }}))
+            continue
         
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token")
+        expected_pieces, expected_pallets = balances.get(
+            product["id"], (product.get("opening_stock_pieces", 0), product.get("opening_stock_pallets", 0)))
+        if (expected_pieces, expected_pallets) == (observed["current_stock_pieces"], observed["current_stock_pallets"]):
+            checkpoints.append(balance_checkpoint(product["id"], expected_pieces, expected_pallets, cutoff))
+            continue
+        report["discrepancies"] += 1
+        if len(report["items"]) < RECONCILE_REPORT_LIMIT:
+            report["items"].append({
+                "product_id": product["id"],
+                "name": product.get("name"),
+                "current_stock_pieces": observed["current_stock_pieces"],
+                "expected_stock_pieces": expected_pieces,
+                "current_stock_pallets": observed["current_stock_pallets"],
+                "expected_stock_pallets": expected_pallets
+            })
+        if repair:
+            # Matching the observed values skips products that changed since they were read
+            operations.append(UpdateOne(observed, [
+                {"$set": {
+                    "current_stock_pieces": expected_pieces,
+                    "current_stock_pallets": expected_pallets,
+                    "updated_at": {"$max": ["$$NOW", "$updated_at"]}
+                }},
+                LOW_STOCK_STAGE
+            ]))
+            repairs.append((product["id"], expected_pieces, expected_pallets))
+    
+    if baselines:
+        await db.products.bulk_write(baselines, ordered=False)
+    if operations:
+        result = await db.products.bulk_write(operations, ordered=False)
+        report["repaired"] += result.modified_count
+        # Which repair missed is unknown, so a miss leaves all of them to be replayed again
+        if result.modified_count == len(repairs):
+            checkpoints += [balance_checkpoint(*item, cutoff) for item in repairs]
+    if checkpoints:
+        await db.reconciliation_balances.bulk_write(checkpoints, ordered=False)
+    repaired = [product_id for product_id, _, _ in repairs]
+    for product_id in repaired:
+        invalidate_product(product_id)
+    if repaired and not EVENTS_CHANGE_STREAM:
+        async for product in db.products.find({"id": {"$in": repaired}}, PRODUCT_PROJECTION | {"low_stock": 1}):
+            publish_event(stock_event(product))
+    return busy
+
+async def reconcile_stock(repair: bool = False, full: bool = False) -> dict:
+    """Compare every product's stock with its replayed movement ledger.
+
+    Incremental runs (the default) only look at products with movements since
+    the last checkpoint; ``full`` checks the whole catalog. With ``repair`` the
+    differences are written back in batched ``bulk_write``s. The checkpoint only
+    advances once every discrepancy found was repaired; products skipped as busy
+    are carried in it and checked again by the next run.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=RECONCILE_SETTLE_SECONDS)
+    checkpoint = await db.reconciliation_checkpoints.find_one({"_id": "stock"})
+    since = None if full or not checkpoint else checkpoint["movements_before"] - RECONCILE_OVERLAP
+    report = {
+        "mode": "full" if since is None else "incremental",
+        "since": since,
+        "cutoff": cutoff,
+        "checked": 0,
+        "discrepancies": 0,
+        "repaired": 0,
+        "busy": 0,
+        "unbaselined": 0,
+        "items": []
+    }
+    
+    if since is None:
+        source = db.products.find({}, {"_id": 0, "id": 1})
+    else:
+        source = db.movements.aggregate([
+            {"$match": {"created_at": {"$gte": since, "$lt": cutoff}}},
+            {"$group": {"_id": "$product_id"}},
+            {"$project": {"_id": 0, "id": "$_id"}}
+        ], allowDiskUse=True)
+    # Busy products of the last run may have no movements inside this window
+    recheck = [] if since is None else checkpoint.get("recheck", [])
+    busy = []
+    for start in range(0, len(recheck), RECONCILE_BATCH_SIZE):
+        busy += await reconcile_batch(recheck[start:start + RECONCILE_BATCH_SIZE], cutoff, repair, report)
+    rechecked = set(recheck)
+    batch = []
+    async for document in source:
+        if document["id"] in rechecked:
+            continue
+        batch.append(document["id"])
+        if len(batch) >= RECONCILE_BATCH_SIZE:
+            busy += await reconcile_batch(batch, cutoff, repair, report)
+            batch = []
+    if batch:
+        busy += await reconcile_batch(batch, cutoff, repair, report)
+    
+    # Unrepaired products (not asked to, or changed before the repair landed) are checked again next run
+    if report["repaired"] == report["discrepancies"]:
+        await db.reconciliation_checkpoints.update_one({"_id": "stock"}, {"$set": {
+            "movements_before": cutoff,
+            "recheck": busy,
+            "completed_at": datetime.now(timezone.utc)
+        }}, upsert=True)
+    return report
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in error.errors())
+
+async def read_bulk_payload(request: Request) -> list:
+    """Read a bulk request body sent either as a JSON array or as NDJSON.
+
+    NDJSON bodies are parsed line by line while they stream in; lines that are
+    not valid JSON are returned as ``ValueError`` instances so the caller can
+    report them per item.
+    """
+    if "ndjson" not in request.headers.get("content-type", ""):
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="JSON inválido")
+        if not isinstance(payload, list):
+            raise HTTPException(status_code=400, detail="Se esperaba una lista de movimientos")
+        return payload
+    
+    items = []
+    buffer = b""
+    
+    def parse(line: bytes):
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append(e)
+    
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                parse(line)
+    if buffer.strip():
+        parse(buffer)
+    return items
+
+def connect_mongo():
+    global client, db
+    options = {
+        option: parse(os.environ[variable])
+        for variable, (option, parse) in MONGO_CLIENT_ENV_OPTIONS.items()
+        if os.environ.get(variable)
+    }
+    # Dates are stored as native BSON datetimes and decoded as timezone-aware UTC
+    client = AsyncIOMotorClient(
+        MONGO_URL,
+        tz_aware=True,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        event_listeners=[pool_monitor, command_monitor],
+        **options
+    )
+    db = client[MONGO_DB_NAME]
+    return db
+
+async def startup():
+    connect_mongo()
+    RequestTracker.draining = False
+    install_shutdown_signal_handlers()
+    await ensure_archive_collection()
+    await ensure_indexes()
+    await backfill_low_stock_flags()
+    # One-off for catalogs created before search existed; runs without delaying startup
+    background_tasks.append(asyncio.create_task(backfill_search_tokens()))
+    # Also covers movements written before transactions were switched on
+    background_tasks.append(asyncio.create_task(drop_stale_apply_keys()))
+    background_tasks.append(asyncio.create_task(sweep_pending_movements()))
+    if (PRODUCT_CACHE_CHANGE_STREAM and PRODUCT_CACHE_SIZE > 0) or EVENTS_CHANGE_STREAM:
+        background_tasks.append(asyncio.create_task(watch_product_changes()))
+
+def begin_shutdown():
+    RequestTracker.draining = True
+    event_broker.close()
+
+def install_shutdown_signal_handlers():
+    """End event streams as soon as SIGINT/SIGTERM arrives.
+
+    uvicorn only runs the lifespan shutdown once every connection has closed,
+    and event streams never close on their own, so waiting for shutdown() to
+    end them would hang the server. The previous handler still runs (uvicorn's
+    asyncio handlers are woken through the signal wakeup fd either way).
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(signum)
         
-        # Verify user exists
-        user = await db.users.find_one({"id": user_id})
-        if not user or not user.get("is_active"):
-            raise HTTPException(status_code=401, detail="User not found or inactive")
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(begin_shutdown)
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                signal.signal(signum, previous)
+                signal.raise_signal(signum)
         
-        return {"user_id": user_id, "username": username}
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        previous_signal_handlers[signum] = previous
+        signal.signal(signum, handler)
+
+def restore_signal_handlers():
+    if threading.current_thread() is threading.main_thread():
+        for signum, previous in previous_signal_handlers.items():
+            signal.signal(signum, previous)
+    previous_signal_handlers.clear()
+
+async def shutdown():
+    # Usually done already by the signal handler; covers servers that never got a signal
+    begin_shutdown()
+    restore_signal_handlers()
+    await RequestTracker.drain(SHUTDOWN_DRAIN_TIMEOUT)
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    client.close()
+
+async def ensure_indexes():
+    # One index per call: a build failing on existing data aborts every index in its call
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                # Usually pre-existing duplicates; keep serving and let an operator clean them up
+                logger.error("Could not create index %s on %s: %s", index.document["name"], collection, e)
+
+async def ensure_archive_collection():
+    # Created explicitly so it gets zstd block compression; index creation would use the default
+    if await db.list_collection_names(filter={"name": "movements_archive"}):
+        return
+    try:
+        await db.create_collection(
+            "movements_archive", storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}})
+    except CollectionInvalid:
+        pass  # created concurrently by another worker
+    except OperationFailure as e:
+        logger.error("Could not create movements_archive with zstd compression: %s", e)
+
+async def archived_before() -> Optional[datetime]:
+    """Movements older than this are read from movements_archive, newer ones from movements.
+
+    None before the first archive run. Rows below it may still sit in movements
+    for a while after a run, so reads from movements must start at it.
+    """
+    checkpoint = await db.archive_checkpoints.find_one({"_id": "movements"})
+    return checkpoint.get("archived_before") if checkpoint else None
+
+async def copy_to_archive(batch: List[dict], on_batch=None) -> int:
+    if on_batch is not None:
+        on_batch(batch)
+    try:
+        await db.movements_archive.insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        # Rows copied by an interrupted run are already there
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+    return len(batch)
+
+async def archive_movements(horizon: datetime, on_batch=None) -> dict:
+    """Move movements created before ``horizon`` into movements_archive.
 
-def prepare_for_mongo(data):
-    if isinstance(data, dict):
-        if 'created_at' in data and isinstance(data['created_at'], datetime):
-            data['created_at'] = data['created_at'].isoformat()
-        if 'updated_at' in data and isinstance(data['updated_at'], datetime):
-            data['updated_at'] = data['updated_at'].isoformat()
-    return data
-
-def parse_from_mongo(item):
-    if isinstance(item, dict):
-        if 'created_at' in item and isinstance(item['created_at'], str):
-            item['created_at'] = datetime.fromisoformat(item['created_at'])
-        if 'updated_at' in item and isinstance(item['updated_at'], str):
-            item['updated_at'] = datetime.fromisoformat(item['updated_at'])
-    return item
+    Every row below the horizon is copied before the checkpoint moves, and the
+    originals are only deleted ARCHIVE_DELETE_GRACE_SECONDS later, so a read
+    that started on the old checkpoint still finds its rows in movements; a read
+    never takes a row from both collections. An interrupted run is simply run
+    again. ``on_batch`` gets every batch before it is copied (e.g. to also write
+    Parquet files).
+    """
+    previous = await archived_before()
+    query = {"created_at": {"$lt": horizon}}
+    if previous is not None:
+        query["created_at"]["$gte"] = previous
+        horizon = max(horizon, previous)
+    archived = 0
+    batch = []
+    async for movement in db.movements.find(query).sort("created_at", 1).batch_size(ARCHIVE_BATCH_SIZE):
+        batch.append(movement)
+        if len(batch) >= ARCHIVE_BATCH_SIZE:
+            archived += await copy_to_archive(batch, on_batch)
+            batch = []
+    if batch:
+        archived += await copy_to_archive(batch, on_batch)
+    
+    await db.archive_checkpoints.update_one(
+        {"_id": "movements"}, {"$max": {"archived_before": horizon}, "$set": {"completed_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    # Also removes what an interrupted run copied but did not get to delete
+    if await db.movements.find_one({"created_at": {"$lt": horizon}}, {"_id": 1}):
+        await asyncio.sleep(ARCHIVE_DELETE_GRACE_SECONDS)
+        while True:
+            ids = [movement["_id"] async for movement in db.movements.find(
+                {"created_at": {"$lt": horizon}}, {"_id": 1}).limit(ARCHIVE_BATCH_SIZE)]
+            if not ids:
+                break
+            await db.movements.delete_many({"_id": {"$in": ids}})
+    return {"archived": archived, "archived_before": horizon}
+
+async def find_movements(query: dict):
+    """Movements matching ``query`` oldest first, reading the archive first when the range reaches into it."""
+    horizon = await archived_before()
+    bounds = query.get("created_at", {})
+    if horizon is not None:
+        if "$gte" not in bounds or bounds["$gte"] < horizon:
+            end = min(bounds["$lt"], horizon) if "$lt" in bounds else horizon
+            archive_query = {**query, "created_at": {**bounds, "$lt": end}}
+            async for movement in db.movements_archive.find(archive_query, MOVEMENT_PROJECTION) \
+                    .sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE):
+                yield movement
+        query = {**query, "created_at": {**bounds, "$gte": max(bounds.get("$gte", horizon), horizon)}}
+    async for movement in db.movements.find(query, MOVEMENT_PROJECTION).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE):
+        yield movement
+
+async def backfill_low_stock_flags():
+    await db.products.update_many({"low_stock": {"$exists": False}}, [LOW_STOCK_STAGE])
+
+async def backfill_search_tokens():
+    operations = []
+    async for product in db.products.find({"search_tokens": {"$exists": False}}, {"_id": 1, "name": 1}):
+        operations.append(UpdateOne({"_id": product["_id"]}, {"$set": {"search_tokens": search_tokens(product.get("name"))}}))
+        if len(operations) >= IMPORT_BATCH_SIZE:
+            await db.products.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db.products.bulk_write(operations, ordered=False)
+
+# format -> (prefix, digits after the prefix, whether a GTIN check digit is appended)
+BARCODE_FORMATS = {
+    "EAN13": (BARCODE_EAN13_PREFIX, 12 - len(BARCODE_EAN13_PREFIX), True),
+    "UPC": (BARCODE_UPC_PREFIX, 11 - len(BARCODE_UPC_PREFIX), True),
+    "CODE128": (BARCODE_CODE128_PREFIX, 10, False),
+}
+
+def format_barcode(barcode_format: str, sequence: int) -> str:
+    prefix, width, check_digit = BARCODE_FORMATS[barcode_format]
+    code = f"{prefix}{sequence:0{width}d}"
+    return code + barcode_render.gtin_check_digit(code) if check_digit else code
+
+async def allocate_barcodes(barcode_format: str, count: int) -> List[str]:
+    """Reserve ``count`` new codes, skipping any already used in the catalog.
+
+    Each round claims a contiguous sequence range with a single ``$inc``; codes
+    that collide with existing products (typed in by hand) are topped up from a
+    fresh range.
+    """
+    _, width, _ = BARCODE_FORMATS[barcode_format]
+    barcodes = []
+    while len(barcodes) < count:
+        needed = count - len(barcodes)
+        counter = await db.counters.find_one_and_update(
+            {"_id": f"barcode:{barcode_format}"},
+            {"$inc": {"value": needed}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        end = counter["value"]
+        if end >= 10 ** width:
+            raise HTTPException(status_code=409, detail=f"Se agotaron los códigos {barcode_format} disponibles")
+        candidates = [format_barcode(barcode_format, sequence) for sequence in range(end - needed + 1, end + 1)]
+        used = set(await db.products.distinct("barcode", {"barcode": {"$in": candidates}}))
+        barcodes.extend(code for code in candidates if code not in used)
+    return barcodes
+
+RENDER_MEDIA_TYPES = {"svg": "image/svg+xml", "png": "image/png", "pdf": "application/pdf"}
+
+async def render_cached(request: Request, media: str, render, *args) -> Response:
+    """Render ``render(*args)`` in the worker pool, memoized and served with an ETag.
+
+    The key hashes every render input, so equal requests share one entry and a
+    matching If-None-Match gets a 304 without rendering anything.
+    """
+    key = hashlib.sha256(json.dumps([render.__name__, *args], default=str).encode()).hexdigest()
+    headers = {"ETag": f'"{key}"', "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    content = render_cache.get(key)
+    if content is None:
+        try:
+            content = await asyncio.get_running_loop().run_in_executor(render_executor, render, *args)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Código de barras inválido: {e}")
+        if len(content) <= BARCODE_RENDER_CACHE_MAX_BYTES:
+            render_cache.set(key, content)
+    return Response(content=content, media_type=RENDER_MEDIA_TYPES[media], headers=headers)
+
+def cache_product(product_doc: Optional[dict]) -> Optional[Product]:
+    if not product_doc:
+        return None
+    product = Product(**product_doc)
+    product_cache.set(("id", product.id), product)
+    if product.barcode:
+        product_cache.set(("barcode", product.barcode), product.id)
+    return product
+
+def invalidate_product(product_id: Optional[str], *barcodes: Optional[str]):
+    if product_id:
+        product_cache.pop(("id", product_id))
+    for barcode in barcodes:
+        if barcode:
+            cached_id = product_cache.pop(("barcode", barcode))
+            if cached_id:
+                product_cache.pop(("id", cached_id))
+
+async def find_product_cached(product_id: Optional[str] = None, barcode: Optional[str] = None) -> Optional[Product]:
+    if barcode is not None:
+        product_id = product_cache.get(("barcode", barcode))
+        if product_id is None:
+            return cache_product(await db.products.find_one({"barcode": barcode}, PRODUCT_PROJECTION))
+    
+    product = product_cache.get(("id", product_id))
+    if product is None:
+        product = cache_product(await db.products.find_one({"id": product_id}, PRODUCT_PROJECTION))
+    if barcode is not None and (product is None or product.barcode != barcode):
+        # The barcode was reassigned by a write on another worker
+        product_cache.pop(("barcode", barcode))
+        return cache_product(await db.products.find_one({"barcode": barcode}, PRODUCT_PROJECTION))
+    return product
+
+STOCK_FIELDS = {"current_stock_pieces", "current_stock_pallets"}
+
+def stock_event(product: dict, delta_pieces: Optional[int] = None, delta_pallets: Optional[int] = None) -> dict:
+    event = {
+        "type": "stock",
+        "product_id": product["id"],
+        "category": product.get("category") or "",
+        "current_stock_pieces": product.get("current_stock_pieces", 0),
+        "current_stock_pallets": product.get("current_stock_pallets", 0),
+        "low_stock": bool(product.get("low_stock"))
+    }
+    if delta_pieces is not None:
+        event["delta_pieces"] = delta_pieces
+        event["delta_pallets"] = delta_pallets
+    return event
+
+def product_event(action: str, product: dict) -> dict:
+    return {
+        "type": "product",
+        "action": action,
+        "product_id": product["id"],
+        "category": product.get("category") or "",
+        "version": product.get("version", 0)
+    }
+
+def publish_event(event: dict):
+    # With EVENTS_CHANGE_STREAM every worker publishes from the change stream instead
+    if not EVENTS_CHANGE_STREAM:
+        event_broker.publish(event)
+
+def publish_stock_change(product: dict, delta_pieces: int, delta_pallets: int):
+    publish_event(stock_event(product, delta_pieces, delta_pallets))
+    if product.get("low_stock") and delta_pieces < 0:
+        publish_event({**stock_event(product), "type": "low_stock"})
+
+def publish_change(change: dict):
+    """Translate a products change-stream event into broker events."""
+    product = change.get("fullDocument")
+    if not product:
+        # Deletes only carry the _id
+        event_broker.publish({"type": "catalog", "action": "deleted"})
+        return
+    if change["operationType"] == "insert":
+        event_broker.publish(product_event("created", product))
+        return
+    updated = set((change.get("updateDescription") or {}).get("updatedFields", {}))
+    if updated & STOCK_FIELDS:
+        event_broker.publish(stock_event(product))
+        if product.get("low_stock") and "low_stock" in updated:
+            event_broker.publish({**stock_event(product), "type": "low_stock"})
+    # applied_movements only tracks in-flight movement keys
+    catalog_fields = {field for field in updated if field.split(".")[0] != "applied_movements"}
+    if change["operationType"] == "replace" or catalog_fields - STOCK_FIELDS - {"low_stock", "updated_at"}:
+        event_broker.publish(product_event("updated", product))
+
+async def watch_product_changes():
+    while True:
+        try:
+            async with db.products.watch(full_document="updateLookup") as stream:
+                async for change in stream:
+                    product = change.get("fullDocument")
+                    if product:
+                        invalidate_product(product.get("id"), product.get("barcode"))
+                    else:
+                        # Deletes only carry the _id, so drop everything
+                        product_cache.clear()
+                    if EVENTS_CHANGE_STREAM:
+                        publish_change(change)
+        except PyMongoError as e:
+            logger.error("Product change stream failed, retrying: %s", e)
+            product_cache.clear()
+            if EVENTS_CHANGE_STREAM:
+                # Changes may have been missed while reconnecting
+                event_broker.publish({"type": "resync", "reason": "change_stream"})
+            await asyncio.sleep(5)
+
+def read_import_rows(upload: UploadFile, format: str):
+    """Yield ``(row_number, row)`` pairs from an uploaded CSV or NDJSON file.
+
+    The spooled upload is read incrementally; unparseable NDJSON lines are
+    yielded as ``ValueError`` instances. Empty CSV cells are dropped so the
+    ``Product`` defaults apply.
+    """
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    if format == "csv":
+        for row_number, row in enumerate(csv.DictReader(text), start=1):
+            yield row_number, {key: value for key, value in row.items() if key and value not in ("", None)}
+        return
+    row_number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, e
+
+async def upsert_import_batch(batch: list, report: dict):
+    """Upsert a batch of ``(row_number, Product)`` pairs keyed on barcode."""
+    operations = []
+    for _, product in batch:
+        product_dict = product.dict()
+        operations.append(UpdateOne(
+            {"barcode": product.barcode},
+            {
+                "$set": {
+                    **{field: product_dict[field] for field in IMPORT_CATALOG_FIELDS},
+                    "search_tokens": search_tokens(product.name)
+                },
+                # Stamped when the row is written, not when the import started, for /api/sync
+                "$currentDate": {"updated_at": True},
+                "$inc": {"version": 1},
+                "$setOnInsert": {
+                    "id": product_dict["id"],
+                    "barcode": product.barcode,
+                    "current_stock_pieces": product_dict["current_stock_pieces"],
+                    "current_stock_pallets": product_dict["current_stock_pallets"],
+                    "created_at": product_dict["created_at"],
+                    "created_by": product_dict["created_by"],
+                    **opening_stock(product_dict)
+                }
+            },
+            upsert=True
+        ))
+    
+    try:
+        result = (await db.products.bulk_write(operations, ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        result = e.details
+        for error in result["writeErrors"]:
+            report["errors"].append({"row": batch[error["index"]][0], "error": error["errmsg"]})
+    report["inserted"] += result["nUpserted"]
+    report["updated"] += result["nMatched"]
+    
+    barcodes = [product.barcode for _, product in batch]
+    await db.products.update_many({"barcode": {"$in": barcodes}}, [LOW_STOCK_STAGE])
+    invalidate_product(None, *barcodes)
+    if PRODUCT_CACHE_SIZE > 0:
+        async for product in db.products.find({"barcode": {"$in": barcodes}}, {"_id": 0, "id": 1}):
+            invalidate_product(product["id"])
+
+def product_etag(product: Product) -> str:
+    return f'"{product.version}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match inválido")
+
+async def update_catalog_fields(product_id: str, changes: dict, if_match: Optional[str]) -> Product:
+    """Apply a catalog edit with ``$set``, guarded by the If-Match version when given.
+
+    Stock fields are never touched, so edits cannot undo concurrent movements.
+    """
+    now = datetime.now(timezone.utc)
+    expected_version = parse_if_match(if_match)
+    query = {"id": product_id}
+    if expected_version is not None:
+        # Documents written before versioning have no field and count as version 0
+        query["version"] = expected_version if expected_version else {"$in": [0, None]}
+    
+    fields = {**changes, "updated_at": now}
+    if "name" in changes:
+        fields["search_tokens"] = search_tokens(changes["name"])
+    # $literal keeps user values such as "$5 cable" from being read as field paths
+    pipeline = [
+        {"$set": {field: {"$literal": value} for field, value in fields.items()}},
+        LOW_STOCK_STAGE,
+        {"$set": {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}}}
+    ]
+    try:
+        previous = await db.products.find_one_and_update(query, pipeline, projection={"_id": 0, "applied_movements": 0})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ya existe un producto con ese código de barras")
+    if previous is None:
+        if expected_version is not None and await db.products.find_one({"id": product_id}, {"_id": 1}):
+            raise HTTPException(status_code=412, detail="El producto fue modificado por otro usuario")
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    
+    invalidate_product(product_id, previous.get("barcode"), changes.get("barcode"))
+    product = Product(**{**previous, **fields, "version": previous.get("version", 0) + 1})
+    publish_event(product_event("updated", product.dict()))
+    return product
 
 # Auth endpoints
 @app.post("/api/auth/register", response_model=dict)
@@ -158,13 +1923,17 @@ async def register_user(user_data: UserCreate):
     user = User(
         username=user_data.username,
         email=user_data.email,
-        password_hash=hash_password(user_data.password),
+        password_hash=await hash_password(user_data.password),
         full_name=user_data.full_name,
         created_at=datetime.now(timezone.utc)
     )
     
-    user_dict = prepare_for_mongo(user.dict())
-    await db.users.insert_one(user_dict)
+    user_dict = user.dict()
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration of the same username/email
+        raise HTTPException(status_code=400, detail="Username or email already exists")
     
     # Create token
     token = create_access_token(user.id, user.username)
@@ -182,9 +1951,17 @@ async def login_user(login_data: UserLogin):
         raise HTTPException(status_code=401, detail="Invalid username or password")
     
     # Verify password
-    if not verify_password(login_data.password, user["password_hash"]):
+    valid, new_hash = await verify_password(login_data.password, user["password_hash"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid username or password")
     
+    # Migrate legacy or outdated hashes to the configured scheme
+    if new_hash:
+        await db.users.update_one(
+            {"id": user["id"], "password_hash": user["password_hash"]},
+            {"$set": {"password_hash": new_hash}}
+        )
+    
     # Check if user is active
     if not user.get("is_active", True):
         raise HTTPException(status_code=401, detail="Account is disabled")
@@ -192,7 +1969,7 @@ async def login_user(login_data: UserLogin):
     # Create token
     token = create_access_token(user["id"], user["username"])
     
-    user_response = UserResponse(**parse_from_mongo(user))
+    user_response = UserResponse(**user)
     
     return {
         "token": token,
@@ -205,27 +1982,187 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return UserResponse(**parse_from_mongo(user))
+    return UserResponse(**user)
 
 # Product endpoints
-@app.get("/api/products", response_model=List[Product])
-async def get_products(current_user: dict = Depends(get_current_user)):
-    products = await db.products.find().to_list(length=None)
-    return [Product(**parse_from_mongo(product)) for product in products]
+@app.get("/api/products", response_model=ProductPage)
+async def get_products(
+    limit: int = Query(PRODUCT_PAGE_SIZE, ge=1, le=PRODUCT_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    low_stock: bool = False,
+    fields: Optional[str] = None,
+    ids: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """List products ordered by (name, id), one page at a time.
+
+    Pass the returned ``next_cursor`` back as ``cursor`` to fetch the following
+    page; it is ``None`` once the catalog has been walked completely. ``ids``
+    (comma separated) restricts the page to those products.
+    """
+    conditions = []
+    if ids:
+        requested = [product_id.strip() for product_id in ids.split(",") if product_id.strip()]
+        if len(requested) > PRODUCT_PAGE_MAX_SIZE:
+            raise HTTPException(status_code=400, detail=f"Máximo {PRODUCT_PAGE_MAX_SIZE} ids por consulta")
+        conditions.append({"id": {"$in": requested}})
+    if category is not None:
+        conditions.append({"category": category})
+    if name_prefix:
+        conditions.append({"name": {"$regex": "^" + re.escape(name_prefix)}})
+    if low_stock:
+        conditions.append({"low_stock": True})
+    if cursor:
+        last_name, last_id = decode_cursor(cursor)
+        conditions.append({"$or": [
+            {"name": {"$gt": last_name}},
+            {"name": last_name, "id": {"$gt": last_id}}
+        ]})
+    query = {"$and": conditions} if conditions else {}
+    
+    products = await db.products.find(query, product_projection(fields)) \
+        .sort([("name", 1), ("id", 1)]) \
+        .limit(limit + 1) \
+        .to_list(length=limit + 1)
+    
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_cursor([products[-1]["name"], products[-1]["id"]])
+    
+    return FastJSONResponse({"items": products, "next_cursor": next_cursor})
+
+async def changes_since(collection, field: str, after: Tuple[datetime, str], until: datetime, projection: dict, limit: int):
+    """Up to ``limit`` documents with ``after < (field, id)`` and ``field < until``, in that order."""
+    position, last_id = after
+    return await db[collection].find(
+        {
+            field: {"$lt": until},
+            "$or": [{field: {"$gt": position}}, {field: position, "id": {"$gt": last_id}}]
+        },
+        projection
+    ).sort([(field, 1), ("id", 1)]).limit(limit).to_list(length=limit)
+
+@app.get("/api/sync")
+async def sync_products(
+    request: Request,
+    token: Optional[str] = None,
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=SYNC_PAGE_MAX_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """Products changed and deleted since the watermark in ``token``.
+
+    Start without a token (or whenever ``reset`` is true: drop the local table
+    first), apply ``items`` and ``deleted``, and call again with ``next_token``
+    while ``has_more``. Keep the last ``next_token`` for the next sync.
+    Responses are gzip-compressed when the client accepts it.
+    """
+    now = datetime.now(timezone.utc)
+    until = now - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    reset = token is None
+    if not reset:
+        try:
+            changed_at, changed_id, deleted_at, deleted_id = decode_cursor(token, size=4)
+            changed = (mongo_datetime(datetime.fromisoformat(changed_at)), changed_id)
+            deleted = (mongo_datetime(datetime.fromisoformat(deleted_at)), deleted_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Token de sincronización inválido")
+        # Deletions older than the tombstone retention may have been forgotten
+        reset = deleted[0] < now - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+    if reset:
+        # A full download only needs the deletions that happen while it runs
+        changed = (datetime.fromtimestamp(0, timezone.utc), "")
+        deleted = (until, "")
+    
+    items = await changes_since("products", "updated_at", changed, until, PRODUCT_PROJECTION, limit)
+    tombstones = await changes_since(
+        "product_tombstones", "deleted_at", deleted, until, {"_id": 0, "id": 1, "barcode": 1, "deleted_at": 1}, limit)
+    
+    # A stream that came back short is caught up, so its watermark moves to the settle bound
+    if len(items) == limit:
+        changed = (items[-1]["updated_at"], items[-1]["id"])
+    elif until > changed[0]:
+        changed = (until, "")
+    if len(tombstones) == limit:
+        deleted = (tombstones[-1]["deleted_at"], tombstones[-1]["id"])
+    elif until > deleted[0]:
+        deleted = (until, "")
+    
+    body = FastJSONResponse({
+        "items": items,
+        "deleted": [{"id": tombstone["id"], "barcode": tombstone["barcode"]} for tombstone in tombstones],
+        "next_token": encode_cursor([changed[0].isoformat(), changed[1], deleted[0].isoformat(), deleted[1]]),
+        "has_more": len(items) == limit or len(tombstones) == limit,
+        "reset": reset
+    }).body
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= SYNC_GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/products/search")
+async def search_products(
+    q: str = Query(..., min_length=1),
+    mode: Literal["auto", "prefix", "text"] = "auto",
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Search products by name, category or description.
+
+    ``prefix`` matches the start of each word of the name ("lap del" finds
+    "Laptop Dell"), ``text`` runs a ranked full-text search, and ``auto``
+    lists prefix matches first followed by the remaining text matches.
+    """
+    window = offset + limit
+    if window > SEARCH_MAX_WINDOW:
+        raise HTTPException(status_code=400, detail=f"Solo se pueden recorrer los primeros {SEARCH_MAX_WINDOW} resultados")
+    projection = product_projection(fields)
+    
+    hits = []
+    exhausted = True
+    if mode in ("auto", "prefix"):
+        words = search_tokens(q)
+        if words:
+            query = {"$and": [{"search_tokens": {"$regex": "^" + re.escape(word)}} for word in words]}
+            prefix_hits = await db.products.find(query, projection) \
+                .sort([("name", 1), ("id", 1)]) \
+                .limit(window) \
+                .to_list(length=window)
+            hits.extend(prefix_hits)
+            exhausted = len(prefix_hits) < window
+    if mode in ("auto", "text") and len(hits) < window:
+        text_hits = await db.products.find({"$text": {"$search": q}}, projection) \
+            .sort([("score", {"$meta": "textScore"})]) \
+            .limit(window) \
+            .to_list(length=window)
+        seen = {hit["id"] for hit in hits}
+        hits.extend(hit for hit in text_hits if hit["id"] not in seen)
+        exhausted = len(text_hits) < window
+    
+    items = hits[offset:window]
+    next_offset = window if len(hits) > window or not exhausted else None
+    return FastJSONResponse({"items": items, "next_offset": next_offset})
 
 @app.get("/api/products/{product_id}", response_model=Product)
-async def get_product(product_id: str, current_user: dict = Depends(get_current_user)):
-    product = await db.products.find_one({"id": product_id})
+async def get_product(product_id: str, response: Response, current_user: dict = Depends(get_current_user)):
+    product = await find_product_cached(product_id=product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return Product(**parse_from_mongo(product))
+    response.headers["ETag"] = product_etag(product)
+    return product
 
 @app.get("/api/products/barcode/{barcode}", response_model=Product)
-async def get_product_by_barcode(barcode: str, current_user: dict = Depends(get_current_user)):
-    product = await db.products.find_one({"barcode": barcode})
+async def get_product_by_barcode(barcode: str, response: Response, current_user: dict = Depends(get_current_user)):
+    product = await find_product_cached(barcode=barcode)
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado con ese código de barras")
-    return Product(**parse_from_mongo(product))
+    response.headers["ETag"] = product_etag(product)
+    return product
 
 @app.post("/api/products", response_model=Product)
 async def create_product(product: Product, current_user: dict = Depends(get_current_user)):
@@ -233,122 +2170,660 @@ async def create_product(product: Product, current_user: dict = Depends(get_curr
     product.created_at = now
     product.updated_at = now
     product.created_by = current_user["user_id"]
+    product.version = 0
     
-    product_dict = prepare_for_mongo(product.dict())
-    await db.products.insert_one(product_dict)
+    product_dict = product.dict()
+    product_dict["low_stock"] = is_low_stock(product_dict)
+    product_dict["search_tokens"] = search_tokens(product_dict["name"])
+    product_dict.update(opening_stock(product_dict))
+    try:
+        await db.products.insert_one(product_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ya existe un producto con ese código de barras")
+    invalidate_product(product.id, product.barcode)
+    publish_event(product_event("created", product_dict))
     return product
 
-@app.put("/api/products/{product_id}", response_model=Product)
-async def update_product(product_id: str, product_update: Product, current_user: dict = Depends(get_current_user)):
-    product_update.updated_at = datetime.now(timezone.utc)
-    product_dict = prepare_for_mongo(product_update.dict())
+@app.post("/api/products/import")
+async def import_products(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Upsert products from a CSV or NDJSON upload, keyed on barcode.
+
+    Existing products keep their stock; only catalog fields are updated.
+    Returns counts plus a row-level error report.
+    """
+    if format is None:
+        format = "ndjson" if (file.filename or "").lower().endswith((".ndjson", ".jsonl")) else "csv"
     
-    result = await db.products.replace_one({"id": product_id}, product_dict)
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    now = datetime.now(timezone.utc)
+    report = {"inserted": 0, "updated": 0, "errors": []}
+    batch = []
+    seen_barcodes = set()
+    for row_number, row in read_import_rows(file, format):
+        if isinstance(row, ValueError):
+            report["errors"].append({"row": row_number, "error": "JSON inválido"})
+            continue
+        if not isinstance(row, dict):
+            report["errors"].append({"row": row_number, "error": "Se esperaba un objeto"})
+            continue
+        try:
+            product = Product(**{**row, "created_at": now, "updated_at": now, "created_by": current_user["user_id"]})
+        except ValidationError as e:
+            report["errors"].append({"row": row_number, "error": validation_message(e)})
+            continue
+        if not product.barcode:
+            report["errors"].append({"row": row_number, "error": "Código de barras requerido"})
+            continue
+        if product.barcode in seen_barcodes:
+            report["errors"].append({"row": row_number, "error": "Código de barras duplicado en el archivo"})
+            continue
+        seen_barcodes.add(product.barcode)
+        
+        batch.append((row_number, product))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await upsert_import_batch(batch, report)
+            batch = []
+    if batch:
+        await upsert_import_batch(batch, report)
     
-    return product_update
+    report["failed"] = len(report["errors"])
+    if report["inserted"] or report["updated"]:
+        publish_event({"type": "catalog", "action": "imported", "inserted": report["inserted"], "updated": report["updated"]})
+    return report
+
+@app.put("/api/products/{product_id}", response_model=Product)
+async def update_product(
+    product_id: str,
+    product_update: Product,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    # Only catalog fields are taken from the body; stock changes go through movements
+    changes = {field: getattr(product_update, field) for field in CATALOG_FIELDS}
+    product = await update_catalog_fields(product_id, changes, if_match)
+    response.headers["ETag"] = product_etag(product)
+    return product
+
+@app.patch("/api/products/{product_id}", response_model=Product)
+async def patch_product(
+    product_id: str,
+    patch: ProductPatch,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    changes = patch.dict(exclude_unset=True)
+    if "name" in changes and not changes["name"]:
+        raise HTTPException(status_code=400, detail="El nombre no puede estar vacío")
+    product = await update_catalog_fields(product_id, changes, if_match)
+    response.headers["ETag"] = product_etag(product)
+    return product
 
 @app.delete("/api/products/{product_id}")
 async def delete_product(product_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.products.delete_one({"id": product_id})
-    if result.deleted_count == 0:
+    deleted = await db.products.find_one_and_delete(
+        {"id": product_id}, projection={"_id": 0, "id": 1, "barcode": 1, "category": 1, "version": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
+    invalidate_product(product_id, deleted.get("barcode"))
+    await db.reconciliation_balances.delete_one({"_id": product_id})
+    await db.product_tombstones.insert_one(
+        {"id": product_id, "barcode": deleted.get("barcode") or "", "deleted_at": datetime.now(timezone.utc)})
+    publish_event(product_event("deleted", deleted))
     return {"message": "Producto eliminado exitosamente"}
 
 # Inventory movement endpoints
 @app.get("/api/movements", response_model=List[InventoryMovement])
 async def get_movements(current_user: dict = Depends(get_current_user)):
-    movements = await db.movements.find().sort("created_at", -1).to_list(length=100)
-    return [InventoryMovement(**parse_from_mongo(movement)) for movement in movements]
+    movements = await db.movements.find({}, MOVEMENT_PROJECTION).sort("created_at", -1).to_list(length=100)
+    return FastJSONResponse(movements)
 
 @app.get("/api/movements/{product_id}", response_model=List[InventoryMovement])
 async def get_product_movements(product_id: str, current_user: dict = Depends(get_current_user)):
-    movements = await db.movements.find({"product_id": product_id}).sort("created_at", -1).to_list(length=50)
-    return [InventoryMovement(**parse_from_mongo(movement)) for movement in movements]
+    horizon = await archived_before()
+    query = {"product_id": product_id}
+    if horizon is not None:
+        query["created_at"] = {"$gte": horizon}
+    movements = await db.movements.find(query, MOVEMENT_PROJECTION) \
+        .sort("created_at", -1) \
+        .to_list(length=50)
+    if len(movements) < 50 and horizon is not None:
+        # Quiet products may only have archived history
+        movements += await db.movements_archive.find(
+            {"product_id": product_id, "created_at": {"$lt": horizon}}, MOVEMENT_PROJECTION) \
+            .sort("created_at", -1) \
+            .to_list(length=50 - len(movements))
+    return FastJSONResponse(movements)
+
+def replayed_movement(original: dict, movement: InventoryMovement, user_id: str) -> InventoryMovement:
+    # A key reused for a different movement is a client bug, not a retry
+    fields = ("product_id", "movement_type", "quantity_pieces", "quantity_pallets")
+    if original.get("created_by") != user_id or any(original.get(field) != getattr(movement, field) for field in fields):
+        raise HTTPException(status_code=422, detail="La clave de idempotencia ya se usó para otro movimiento")
+    return InventoryMovement(**original)
 
 @app.post("/api/movements", response_model=InventoryMovement)
-async def create_movement(movement: InventoryMovement, current_user: dict = Depends(get_current_user)):
-    # Validate product exists
-    product = await db.products.find_one({"id": movement.product_id})
-    if not product:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
+async def create_movement(
+    movement: InventoryMovement,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Record a movement. Retries are safe when the client sends an
+    ``Idempotency-Key`` header or its own movement ``id``: the original movement
+    is returned (with ``Idempotent-Replayed: true``) and stock is not changed again.
+    """
+    if idempotency_key:
+        movement.id = str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, f"{current_user['user_id']}:{idempotency_key}"))
+    elif not movement.id:
+        movement.id = str(uuid.uuid4())
+    keyed = bool(idempotency_key) or "id" in movement.model_fields_set
+    if keyed:
+        original = idempotency_cache.get(movement.id)
+        if original is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return replayed_movement(original, movement, current_user["user_id"])
     
     movement.created_at = datetime.now(timezone.utc)
     movement.created_by = current_user["user_id"]
     movement.user_name = current_user["username"]
     
-    movement_dict = prepare_for_mongo(movement.dict())
-    await db.movements.insert_one(movement_dict)
+    try:
+        product = await apply_movement(movement)
+    except MovementHandedOver:
+        # Recorded but stalled; the sweeper applies the stock change and publishes it
+        logger.warning("Movement %s left to the pending sweeper", movement.id)
+        if keyed:
+            idempotency_cache.set(movement.id, movement.dict())
+        return movement
+    except DuplicateKeyError:
+        original = await db.movements.find_one({"id": movement.id}, MOVEMENT_PROJECTION)
+        if original is None:
+            # The first attempt failed and was rolled back in the meantime
+            raise HTTPException(status_code=409, detail="El movimiento está siendo procesado, reintente")
+        idempotency_cache.set(movement.id, original)
+        response.headers["Idempotent-Replayed"] = "true"
+        return replayed_movement(original, movement, current_user["user_id"])
+    if not product:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    invalidate_product(movement.product_id)
+    sign = 1 if movement.movement_type == "entry" else -1
+    publish_stock_change(product, sign * movement.quantity_pieces, sign * movement.quantity_pallets)
+    if keyed:
+        idempotency_cache.set(movement.id, movement.dict())
     
-    # Update product stock
-    product_obj = Product(**parse_from_mongo(product))
+    return movement
+
+@app.post("/api/movements/bulk", response_model=BulkMovementResponse)
+async def create_movements_bulk(request: Request, current_user: dict = Depends(get_current_user)):
+    """Ingest a batch of scanner movements (JSON array or NDJSON).
+
+    Valid items are written with one ``insert_many`` and their stock deltas are
+    summed per product into one ``bulk_write``. Exit floors are applied to each
+    product's net delta for the batch. Items carrying an ``id`` that was already
+    recorded are reported as ``duplicate`` instead of being applied again.
+    """
+    payload = await read_bulk_payload(request)
+    if len(payload) > MOVEMENT_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {MOVEMENT_BULK_MAX_ITEMS} movimientos por lote")
     
-    if movement.movement_type == "entry":
-        product_obj.current_stock_pieces += movement.quantity_pieces
-        product_obj.current_stock_pallets += movement.quantity_pallets
-    else:  # exit
-        product_obj.current_stock_pieces = max(0, product_obj.current_stock_pieces - movement.quantity_pieces)
-        product_obj.current_stock_pallets = max(0, product_obj.current_stock_pallets - movement.quantity_pallets)
+    results = [BulkMovementResult(index=index, status="error") for index in range(len(payload))]
+    items = {}
+    for index, raw in enumerate(payload):
+        if isinstance(raw, ValueError):
+            results[index].error = "JSON inválido"
+            continue
+        try:
+            items[index] = BulkMovementItem.model_validate(raw)
+        except ValidationError as e:
+            results[index].error = validation_message(e)
     
-    product_obj.updated_at = datetime.now(timezone.utc)
-    updated_product_dict = prepare_for_mongo(product_obj.dict())
-    await db.products.replace_one({"id": movement.product_id}, updated_product_dict)
+    product_ids = {item.product_id for item in items.values()}
+    existing_ids = set()
+    if product_ids:
+        async for product in db.products.find({"id": {"$in": list(product_ids)}}, {"_id": 0, "id": 1}):
+            existing_ids.add(product["id"])
     
-    return movement
+    # Items retried with their client ids are reported, not applied again
+    client_ids = [item.id for item in items.values() if item.id]
+    recorded_ids = set()
+    if client_ids:
+        async for movement in db.movements.find({"id": {"$in": client_ids}}, {"_id": 0, "id": 1}):
+            recorded_ids.add(movement["id"])
+    
+    now = datetime.now(timezone.utc)
+    movements = []
+    for index, item in items.items():
+        if item.product_id not in existing_ids:
+            results[index].error = "Producto no encontrado"
+            continue
+        if item.id and item.id in recorded_ids:
+            results[index].status = "duplicate"
+            results[index].id = item.id
+            continue
+        if item.id:
+            recorded_ids.add(item.id)
+        movement = InventoryMovement(
+            **item.dict(exclude_none=True),
+            created_at=now,
+            created_by=current_user["user_id"],
+            user_name=current_user["username"]
+        )
+        movements.append((index, movement))
+    # The whole batch is applied under one key, see stock_update()
+    batch_id = str(uuid.uuid4())
+    deadline = now + timedelta(seconds=PENDING_MOVEMENT_GRACE_SECONDS)
+    movement_docs = [movement.dict() for _, movement in movements]
+    
+    deltas = {}
+    rollups = {}
+    balances = {}
+    duplicates = set()
+    
+    async def write(session=None):
+        deltas.clear()
+        rollups.clear()
+        balances.clear()
+        duplicates.clear()
+        try:
+            await db.movements.insert_many(
+                [{**document, "batch_id": batch_id, "applied": session is not None} for document in movement_docs],
+                ordered=False,
+                session=session
+            )
+        except BulkWriteError as e:
+            # Only a concurrent retry of the same batch is expected to collide; inside a
+            # transaction the write error has already aborted it, so give up and let the client retry
+            if session is not None or any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            duplicates.update(error["index"] for error in e.details["writeErrors"])
+        
+        for position, (_, movement) in enumerate(movements):
+            if position in duplicates:
+                continue
+            sign = 1 if movement.movement_type == "entry" else -1
+            pieces, pallets = deltas.get(movement.product_id, (0, 0))
+            deltas[movement.product_id] = (pieces + sign * movement.quantity_pieces, pallets + sign * movement.quantity_pallets)
+            counts = rollups.setdefault(movement.product_id, {})
+            for key, value in rollup_counts(movement.movement_type, movement.quantity_pieces, movement.quantity_pallets).items():
+                counts[key] = counts.get(key, 0) + value
+        if not deltas:
+            return
+        
+        apply_key = None if session is not None else batch_id
+        if session is None:
+            check_hold(deadline)
+        await db.products.bulk_write(
+            [UpdateOne(applied_filter(product_id, apply_key), stock_update(pieces, pallets, apply_key))
+             for product_id, (pieces, pallets) in deltas.items()],
+            ordered=False,
+            session=session
+        )
+        async for product in db.products.find(
+            {"id": {"$in": list(deltas)}},
+            {"_id": 0, "id": 1, "category": 1, "current_stock_pieces": 1, "current_stock_pallets": 1, "low_stock": 1},
+            session=session
+        ):
+            balances[product["id"]] = product
+        if session is None:
+            check_hold(deadline)
+        await write_rollups(
+            [operation
+             for product_id, counts in rollups.items()
+             for operation in rollup_operations(product_id, now, counts, balances.get(product_id), apply_key)],
+            session=session
+        )
+        if session is None:
+            check_hold(deadline)
+            await finish_movements(batch_id, {"batch_id": batch_id}, list(deltas))
+    
+    if movement_docs:
+        if USE_TRANSACTIONS:
+            try:
+                async with await client.start_session() as session:
+                    await session.with_transaction(write)
+            except BulkWriteError:
+                raise HTTPException(status_code=409, detail="Parte del lote ya se está procesando, reintente")
+        else:
+            try:
+                await write()
+            except MovementHandedOver:
+                # Recorded but stalled; the sweeper applies the rest and publishes it
+                logger.warning("Movement batch %s left to the pending sweeper", batch_id)
+                deltas.clear()
+        for product_id, (pieces, pallets) in deltas.items():
+            invalidate_product(product_id)
+            if product_id in balances:
+                publish_stock_change(balances[product_id], pieces, pallets)
+    
+    for position, (index, movement) in enumerate(movements):
+        results[index].id = movement.id
+        results[index].status = "duplicate" if position in duplicates else "created"
+    
+    created = sum(1 for result in results if result.status == "created")
+    duplicated = sum(1 for result in results if result.status == "duplicate")
+    return BulkMovementResponse(
+        created=created,
+        duplicates=duplicated,
+        failed=len(payload) - created - duplicated,
+        results=results
+    )
+
+# Real-time events
+@app.get("/api/events")
+async def stream_events(
+    request: Request,
+    product_id: Optional[List[str]] = Query(None),
+    category: Optional[List[str]] = Query(None),
+    current_user: dict = Depends(get_event_stream_user)
+):
+    """Server-Sent Events stream of stock, low-stock and catalog changes.
+
+    ``product_id`` and ``category`` may be repeated to filter. A ``resync``
+    event means events were missed and the client should reload its data.
+    """
+    subscriber = event_broker.subscribe(product_id or (), category or ())
+    if RequestTracker.draining:
+        # Shutting down: end right away so the client reconnects to another worker
+        event_broker.disconnect(subscriber, {"type": "resync", "reason": "shutdown"})
+    
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+        finally:
+            event_broker.unsubscribe(subscriber)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Keep reverse proxies such as nginx from buffering the stream
+        "X-Accel-Buffering": "no"
+    })
+
+# Export endpoints
+@app.get("/api/export/products")
+async def export_products(
+    format: Literal["csv", "ndjson"] = "csv",
+    category: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    query = {"category": category} if category is not None else {}
+    fields = list(Product.model_fields)
+    cursor = db.products.find(query, product_projection()) \
+        .sort([("name", 1), ("id", 1)]) \
+        .batch_size(EXPORT_BATCH_SIZE)
+    return export_response(cursor, fields, format, "products")
+
+@app.get("/api/export/movements")
+async def export_movements(
+    format: Literal["csv", "ndjson"] = "csv",
+    product_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    query = created_at_range(start, end)
+    if product_id is not None:
+        query["product_id"] = product_id
+    fields = list(InventoryMovement.model_fields)
+    return export_response(find_movements(query), fields, format, "movements")
+
+# Stock history and reports
+@app.get("/api/products/{product_id}/stock-history")
+async def get_stock_history(
+    product_id: str,
+    granularity: Literal["hour", "day"] = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Movement totals and ending balance per bucket, oldest first. Buckets without movements are omitted."""
+    query = {"product_id": product_id, "granularity": granularity}
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = bucket_start(start, granularity)
+    if end is not None:
+        bounds["$lt"] = mongo_datetime(end)
+    if bounds:
+        query["bucket"] = bounds
+    buckets = await db.movement_rollups.find(query, {"_id": 0, "applied_movements": 0}).sort("bucket", 1).to_list(length=limit)
+    return FastJSONResponse(buckets)
+
+@app.get("/api/reports/top-movers")
+async def get_top_movers(
+    start: datetime,
+    end: Optional[datetime] = None,
+    granularity: Literal["hour", "day"] = "day",
+    by: Literal["volume_pieces", "exits_pieces", "entries_pieces", "movements"] = "volume_pieces",
+    limit: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    bounds = {"$gte": bucket_start(start, granularity)}
+    if end is not None:
+        bounds["$lt"] = mongo_datetime(end)
+    movers = await db.movement_rollups.aggregate([
+        {"$match": {"granularity": granularity, "bucket": bounds}},
+        {"$group": {
+            "_id": "$product_id",
+            "movements": {"$sum": "$movements"},
+            "entries_pieces": {"$sum": "$entries_pieces"},
+            "exits_pieces": {"$sum": "$exits_pieces"},
+            "net_pieces": {"$sum": "$net_pieces"},
+            "net_pallets": {"$sum": "$net_pallets"}
+        }},
+        {"$set": {"volume_pieces": {"$add": ["$entries_pieces", "$exits_pieces"]}}},
+        {"$sort": {by: -1, "_id": 1}},
+        {"$limit": limit},
+        {"$lookup": {"from": "products", "localField": "_id", "foreignField": "id", "as": "product"}},
+        {"$unwind": {"path": "$product", "preserveNullAndEmptyArrays": True}},
+        {"$project": {
+            "_id": 0,
+            "product_id": "$_id",
+            "name": "$product.name",
+            "barcode": "$product.barcode",
+            "category": "$product.category",
+            "movements": 1,
+            "entries_pieces": 1,
+            "exits_pieces": 1,
+            "volume_pieces": 1,
+            "net_pieces": 1,
+            "net_pallets": 1
+        }}
+    ]).to_list(length=limit)
+    return FastJSONResponse(movers)
 
 # Barcode generation endpoint
 @app.get("/api/generate-barcode/{format}")
 async def generate_barcode(format: str, current_user: dict = Depends(get_current_user)):
     """Generate a new barcode in specified format (EAN13, UPC, CODE128)"""
-    if format.upper() == "EAN13":
-        # Generate 13-digit EAN code (12 digits + check digit)
-        import random
-        code = "".join([str(random.randint(0, 9)) for _ in range(12)])
-        # Simple EAN-13 check digit calculation
-        odd_sum = sum([int(code[i]) for i in range(0, 12, 2)])
-        even_sum = sum([int(code[i]) for i in range(1, 12, 2)])
-        check_digit = (10 - ((odd_sum + even_sum * 3) % 10)) % 10
-        barcode = code + str(check_digit)
-    elif format.upper() == "UPC":
-        # Generate 12-digit UPC code
-        import random
-        code = "".join([str(random.randint(0, 9)) for _ in range(11)])
-        # Simple UPC check digit calculation
-        odd_sum = sum([int(code[i]) for i in range(0, 11, 2)])
-        even_sum = sum([int(code[i]) for i in range(1, 11, 2)])
-        check_digit = (10 - ((odd_sum * 3 + even_sum) % 10)) % 10
-        barcode = code + str(check_digit)
-    else:  # CODE128
-        import random
-        barcode = "INV" + "".join([str(random.randint(0, 9)) for _ in range(10)])
-    
-    return {"barcode": barcode, "format": format.upper()}
+    barcode_format = format.upper() if format.upper() in BARCODE_FORMATS else "CODE128"
+    barcodes = await allocate_barcodes(barcode_format, 1)
+    return {"barcode": barcodes[0], "format": format.upper()}
+
+@app.post("/api/barcodes/batch")
+async def generate_barcode_batch(request: BarcodeBatchRequest, current_user: dict = Depends(get_current_user)):
+    """Reserve up to BARCODE_BATCH_MAX unique barcodes in one call, e.g. to label a shipment"""
+    barcodes = await allocate_barcodes(request.format, request.count)
+    return FastJSONResponse({"format": request.format, "count": len(barcodes), "barcodes": barcodes})
+
+@app.get("/api/barcodes/{code}/render")
+async def render_barcode(
+    code: str,
+    request: Request,
+    format: Literal["auto", "EAN13", "UPC", "CODE128"] = "auto",
+    image: Literal["svg", "png"] = "svg",
+    module_width: int = Query(2, ge=1, le=10),
+    height: int = Query(80, ge=10, le=500),
+    current_user: dict = Depends(get_current_user)
+):
+    """Render a barcode as SVG or PNG; "auto" picks EAN13/UPC for valid GTINs and CODE128 otherwise"""
+    symbology = barcode_render.detect_symbology(code) if format == "auto" else format
+    if image == "svg":
+        return await render_cached(request, image, barcode_render.render_svg, code, symbology, module_width, height)
+    return await render_cached(request, image, barcode_render.render_png, code, symbology, module_width, height)
+
+@app.post("/api/labels/pdf")
+async def label_sheet_pdf(
+    sheet: LabelSheetRequest,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """PDF label sheet (name and barcode) for the given products, in request order"""
+    if len(sheet.product_ids) * sheet.copies > LABEL_SHEET_MAX_LABELS:
+        raise HTTPException(status_code=400, detail=f"Máximo {LABEL_SHEET_MAX_LABELS} etiquetas por hoja")
+    
+    products = {
+        product["id"]: product
+        async for product in db.products.find(
+            {"id": {"$in": sheet.product_ids}, "barcode": {"$gt": ""}},
+            {"_id": 0, "id": 1, "name": 1, "barcode": 1}
+        )
+    }
+    labels = [
+        (products[product_id]["name"], products[product_id]["barcode"],
+         barcode_render.detect_symbology(products[product_id]["barcode"]))
+        for product_id in sheet.product_ids if product_id in products
+        for _ in range(sheet.copies)
+    ]
+    if not labels:
+        raise HTTPException(status_code=404, detail="Ningún producto con código de barras")
+    
+    # Labels are part of the cache key, so renaming a product yields a new sheet
+    response = await render_cached(request, "pdf", barcode_render.render_label_sheet, labels, sheet.columns, sheet.rows)
+    response.headers["X-Labels-Skipped"] = str(sum(1 for product_id in sheet.product_ids if product_id not in products))
+    return response
 
 # Dashboard/Statistics endpoints
 @app.get("/api/dashboard")
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
-    total_products = await db.products.count_documents({})
-    total_movements = await db.movements.count_documents({})
+    # Collection metadata counts, O(1) regardless of collection size
+    total_products = await db.products.estimated_document_count()
+    total_movements = await db.movements.estimated_document_count() + \
+        await db.movements_archive.estimated_document_count()
+    horizon = await archived_before()
+    if horizon is not None:
+        # Rows already copied to the archive but not yet deleted (a short range on the created_at index)
+        total_movements -= await db.movements.count_documents({"created_at": {"$lt": horizon}})
     
-    # Low stock products
-    low_stock_products = []
-    async for product in db.products.find():
-        product_obj = Product(**parse_from_mongo(product))
-        if product_obj.current_stock_pieces <= product_obj.min_stock_alert:
-            low_stock_products.append(product_obj.name)
+    # Low stock products, counted and sampled server-side from the partial low_stock index
+    low_stock = await db.products.aggregate([
+        {"$match": {"low_stock": True}},
+        {"$facet": {
+            "count": [{"$count": "value"}],
+            "names": [{"$sort": {"name": 1}}, {"$limit": 3}, {"$project": {"_id": 0, "name": 1}}]
+        }}
+    ]).to_list(length=1)
+    low_stock_count = low_stock[0]["count"][0]["value"] if low_stock and low_stock[0]["count"] else 0
+    low_stock_products = [product["name"] for product in low_stock[0]["names"]] if low_stock else []
     
     # Recent movements (limited to 3)
-    recent_movements = await db.movements.find().sort("created_at", -1).limit(3).to_list(length=3)
+    recent_movements = await db.movements.find({}, MOVEMENT_PROJECTION).sort("created_at", -1).limit(3).to_list(length=3)
     
     return {
         "total_products": total_products,
         "total_movements": total_movements,
-        "low_stock_count": len(low_stock_products),
-        "low_stock_products": low_stock_products[:3],
-        "recent_movements": [InventoryMovement(**parse_from_mongo(mov)) for mov in recent_movements]
+        "low_stock_count": low_stock_count,
+        "low_stock_products": low_stock_products,
+        "recent_movements": recent_movements
+    }
+
+# Admin endpoints
+@app.get("/api/admin/index-stats")
+async def get_index_stats(current_user: dict = Depends(get_current_user)):
+    stats = {}
+    for collection in INDEXES:
+        stats[collection] = [
+            {
+                "name": index["name"],
+                "key": dict(index["key"]),
+                "ops": int(index["accesses"]["ops"]),
+                "since": index["accesses"]["since"]
+            }
+            async for index in db[collection].aggregate([{"$indexStats": {}}])
+        ]
+    return stats
+
+@app.post("/api/admin/reconcile")
+async def reconcile(repair: bool = False, full: bool = False, current_user: dict = Depends(get_admin_user)):
+    """Report (and with ``repair``, fix) stock that disagrees with the movement ledger"""
+    return FastJSONResponse(await reconcile_stock(repair=repair, full=full))
+
+@app.get("/api/admin/cache-stats")
+async def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    return {
+        "products": product_cache.stats(),
+        "tokens": token_cache.stats(),
+        "users": active_user_cache.stats(),
+        "renders": render_cache.stats()
     }
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "service": "Inventory Management API"}
\ No newline at end of file
+    return {"status": "healthy", "service": "Inventory Management API"}
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    lines = []
+    for histogram in metrics.values():
+        lines.extend(histogram.render())
+    
+    pool = pool_monitor.stats()
+    for name in ("open_connections", "checked_out", "waiting"):
+        lines.append(f"# TYPE mongodb_pool_{name} gauge")
+        lines.append(f"mongodb_pool_{name} {pool[name]}")
+    lines.append("# TYPE mongodb_pool_checkout_failures_total counter")
+    lines.append(f"mongodb_pool_checkout_failures_total {pool['checkout_failures']}")
+    
+    caches = {
+        "products": product_cache.stats(),
+        "tokens": token_cache.stats(),
+        "users": active_user_cache.stats(),
+        "renders": render_cache.stats()
+    }
+    for name, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"),
+                       ("expirations", "counter"), ("size", "gauge")):
+        metric = f"cache_{name}_total" if kind == "counter" else f"cache_{name}"
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f'{metric}{{cache="{cache_name}"}} {stats[name]}' for cache_name, stats in caches.items())
+    
+    lines.append("# TYPE events_subscribers gauge")
+    lines.append(f"events_subscribers {len(event_broker.subscribers)}")
+    lines.append("# TYPE events_published_total counter")
+    lines.append(f"events_published_total {event_broker.published}")
+    lines.append("# TYPE events_dropped_subscribers_total counter")
+    lines.append(f"events_dropped_subscribers_total {event_broker.dropped}")
+    
+    lines.append("# TYPE http_requests_in_flight gauge")
+    lines.append(f"http_requests_in_flight {RequestTracker.in_flight}")
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    if RequestTracker.draining:
+        return JSONResponse(status_code=503, content={"status": "draining"})
+    started = time.perf_counter()
+    try:
+        await db.command("ping")
+    except PyMongoError as e:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "error": str(e)})
+    return {
+        "status": "ready",
+        "ping_ms": round((time.perf_counter() - started) * 1000, 3),
+        "in_flight_requests": RequestTracker.in_flight,
+        "pool": pool_monitor.stats()
+    }
\ No newline at end of file
@@ -323,14 +323,14 @@ class InventoryAPITester:
         try:
             response = requests.get(f"{self.base_url}/products", timeout=10)
             if response.status_code == 200:
-                products = response.json()
-                if isinstance(products, list):
+                page = response.json()
+                if isinstance(page.get('items'), list) and 'next_cursor' in page:
                     self.log_result("Product Listing", True, 
-                                  f"Retrieved {len(products)} products")
+                                  f"Retrieved {len(page['items'])} products")
                     return True
                 else:
                     self.log_result("Product Listing", False, 
-                                  "Products response is not a list")
+                                  "Products response is not a page")
                     return False
             else:
                 self.log_result("Product Listing", False, 
@@ -3,6 +3,10 @@ import Quagga from 'quagga';
 import JsBarcode from 'jsbarcode';
 import './App.css';
 
+// Product list pages carry only what the views render
+const PRODUCT_PAGE_SIZE = 100;
+const PRODUCT_LIST_FIELDS = 'name,barcode,category,current_stock_pieces,current_stock_pallets,pieces_per_pallet,min_stock_alert,price_per_piece,version';
+
 // Auth Context
 const AuthContext = createContext();
 
@@ -311,6 +315,9 @@ const RegisterForm = ({ onToggleLogin }) => {
 function InventoryApp() {
   const [currentView, setCurrentView] = useState('dashboard');
   const [products, setProducts] = useState([]);
+  const [productsCursor, setProductsCursor] = useState(null);
+  const [productSearch, setProductSearch] = useState('');
+  const [productNames, setProductNames] = useState({});
   const [movements, setMovements] = useState([]);
   const [dashboardStats, setDashboardStats] = useState({});
   const [loading, setLoading] = useState(false);
@@ -345,6 +352,8 @@ function InventoryApp() {
   const [selectedProduct, setSelectedProduct] = useState(null);
   const scannerRef = useRef(null);
   const barcodeRef = useRef(null);
+  // Read by the event handlers, which outlive the render that created them
+  const productList = useRef({ cursor: null, search: '' });
   
   const { user, token, logout } = useAuth();
   const API_URL = process.env.REACT_APP_BACKEND_URL;
@@ -364,6 +373,65 @@ function InventoryApp() {
     }
   }, [token]);
 
+  // Live stock updates from other scanners instead of re-fetching
+  useEffect(() => {
+    if (!token) return;
+    const events = new EventSource(`${API_URL}/api/events?access_token=${encodeURIComponent(token)}`);
+    events.addEventListener('stock', (event) => {
+      const change = JSON.parse(event.data);
+      setProducts(prev => prev.map(product => product.id === change.product_id
+        ? { ...product, current_stock_pieces: change.current_stock_pieces, current_stock_pallets: change.current_stock_pallets }
+        : product));
+    });
+    const removeProduct = (productId) => {
+      setProducts(prev => prev.filter(product => product.id !== productId));
+    };
+    // Only the changed product is fetched; the list keeps the API's (name, id) order
+    const upsertProduct = (changed) => {
+      setProducts(prev => {
+        const existing = prev.find(product => product.id === changed.id);
+        if (existing && (existing.version || 0) > (changed.version || 0)) return prev;
+        const rest = prev.filter(product => product.id !== changed.id);
+        const { cursor, search } = productList.current;
+        if (!changed.name.startsWith(search)) return rest;
+        const index = rest.findIndex(product => product.name > changed.name
+          || (product.name === changed.name && product.id > changed.id));
+        // Past the last loaded page it shows up once that page is loaded
+        if (index === -1) return cursor ? rest : [...rest, changed];
+        return [...rest.slice(0, index), changed, ...rest.slice(index)];
+      });
+    };
+    events.addEventListener('product', async (event) => {
+      const change = JSON.parse(event.data);
+      loadDashboard();
+      if (change.action === 'deleted') {
+        removeProduct(change.product_id);
+        return;
+      }
+      try {
+        const response = await fetch(`${API_URL}/api/products/${encodeURIComponent(change.product_id)}`, {
+          headers: apiHeaders
+        });
+        if (response.status === 404) {
+          removeProduct(change.product_id);
+        } else if (response.ok) {
+          upsertProduct(await response.json());
+        }
+      } catch (error) {
+        console.error('Error loading product:', error);
+      }
+    });
+    // Imports and change-stream deletes name no single product, so those reload the first page
+    const reload = () => {
+      loadProducts(productList.current.search);
+      loadDashboard();
+    };
+    events.addEventListener('low_stock', loadDashboard);
+    events.addEventListener('catalog', reload);
+    events.addEventListener('resync', reload);
+    return () => events.close();
+  }, [token]);
+
   // Dark mode effect
   useEffect(() => {
     if (darkMode) {
@@ -373,20 +441,63 @@ function InventoryApp() {
     }
   }, [darkMode]);
 
-  const loadProducts = async () => {
+  const fetchProductPage = async (options) => {
+    const params = new URLSearchParams({ limit: String(PRODUCT_PAGE_SIZE), fields: PRODUCT_LIST_FIELDS, ...options });
+    const response = await fetch(`${API_URL}/api/products?${params}`, {
+      headers: apiHeaders
+    });
+    return response.ok ? response.json() : null;
+  };
+
+  // One page at a time: the first one here, the next ones from loadMoreProducts()
+  const loadProducts = async (search = productList.current.search) => {
     try {
-      const response = await fetch(`${API_URL}/api/products`, {
-        headers: apiHeaders
-      });
-      if (response.ok) {
-        const data = await response.json();
-        setProducts(data);
-      }
+      const data = await fetchProductPage(search ? { name_prefix: search } : {});
+      if (!data) return;
+      productList.current = { cursor: data.next_cursor, search };
+      setProducts(data.items);
+      setProductsCursor(data.next_cursor);
+      setProductSearch(search);
     } catch (error) {
       console.error('Error loading products:', error);
     }
   };
 
+  const loadMoreProducts = async () => {
+    const { cursor, search } = productList.current;
+    if (!cursor) return;
+    try {
+      const data = await fetchProductPage(search ? { cursor, name_prefix: search } : { cursor });
+      if (!data || productList.current.cursor !== cursor) return;
+      productList.current = { cursor: data.next_cursor, search };
+      setProducts(prev => [...prev, ...data.items.filter(item => !prev.some(product => product.id === item.id))]);
+      setProductsCursor(data.next_cursor);
+    } catch (error) {
+      console.error('Error loading products:', error);
+    }
+  };
+
+  const submitProductSearch = (e) => {
+    e.preventDefault();
+    loadProducts(new FormData(e.target).get('search').trim());
+  };
+
+  // Movement lists name products that may not be on a loaded page
+  const loadProductNames = async (items) => {
+    const ids = [...new Set(items.map(movement => movement.product_id))];
+    if (ids.length === 0) return;
+    try {
+      const data = await fetchProductPage({ ids: ids.join(','), fields: 'name', limit: String(ids.length) });
+      if (!data) return;
+      // null marks products that no longer exist
+      const names = Object.fromEntries(ids.map(id => [id, null]));
+      data.items.forEach(product => { names[product.id] = product.name; });
+      setProductNames(prev => ({ ...prev, ...names }));
+    } catch (error) {
+      console.error('Error loading product names:', error);
+    }
+  };
+
   const loadMovements = async () => {
     try {
       const response = await fetch(`${API_URL}/api/movements`, {
@@ -395,6 +506,7 @@ function InventoryApp() {
       if (response.ok) {
         const data = await response.json();
         setMovements(data);
+        loadProductNames(data);
       }
     } catch (error) {
       console.error('Error loading movements:', error);
@@ -409,6 +521,7 @@ function InventoryApp() {
       if (response.ok) {
         const data = await response.json();
         setDashboardStats(data);
+        loadProductNames(data.recent_movements || []);
       }
     } catch (error) {
       console.error('Error loading dashboard:', error);
@@ -650,7 +763,20 @@ function InventoryApp() {
     };
   }, [scannerActive]);
 
-  const printInventory = () => {
+  const printInventory = async () => {
+    const products = [];
+    try {
+      let cursor = null;
+      do {
+        const data = await fetchProductPage(cursor ? { limit: '500', cursor } : { limit: '500' });
+        if (!data) return;
+        products.push(...data.items);
+        cursor = data.next_cursor;
+      } while (cursor);
+    } catch (error) {
+      console.error('Error loading products:', error);
+      return;
+    }
     const printContent = `
       <!DOCTYPE html>
       <html>
@@ -725,7 +851,8 @@ function InventoryApp() {
       
       // Auto-calculate pieces when pallets change
       if (field === 'quantity_pallets') {
-        const product = products.find(p => p.id === prevForm.product_id);
+        const product = products.find(p => p.id === prevForm.product_id)
+          || (selectedProduct && selectedProduct.id === prevForm.product_id ? selectedProduct : null);
         if (product && product.pieces_per_pallet) {
           const pallets = parseInt(value) || 0;
           newForm.quantity_pieces = (pallets * product.pieces_per_pallet).toString();
@@ -734,7 +861,7 @@ function InventoryApp() {
       
       return newForm;
     });
-  }, [products]);
+  }, [products, selectedProduct]);
 
   const Navigation = () => (
     <nav className={`${darkMode ? 'bg-gray-800' : 'bg-white'} shadow-sm border-b`}>
@@ -910,7 +1037,7 @@ function InventoryApp() {
             </h3>
             <div className="space-y-3">
               {dashboardStats.recent_movements.map((movement, index) => {
-                const product = products.find(p => p.id === movement.product_id);
+                const productName = productNames[movement.product_id];
                 return (
                   <div key={index} className={`p-3 rounded ${darkMode ? 'bg-gray-700' : 'bg-gray-50'}`}>
                     <div className="flex justify-between items-start">
@@ -928,7 +1055,7 @@ function InventoryApp() {
                           </span>
                         </div>
                         <p className="text-sm font-medium">
-                          {product ? product.name : 'Producto eliminado'}
+                          {productName === null ? 'Producto eliminado' : productName}
                         </p>
                         <p className="text-sm text-gray-500">
                           {movement.quantity_pallets} pallets, {movement.quantity_pieces} piezas
@@ -1043,6 +1170,18 @@ function InventoryApp() {
         </div>
 
         {/* Products List */}
+        <form onSubmit={submitProductSearch} className="flex space-x-2 mb-4">
+          <input
+            name="search"
+            type="text"
+            placeholder="Buscar por nombre"
+            defaultValue={productSearch}
+            className={`flex-1 p-3 border rounded-lg ${darkMode ? 'bg-gray-700 border-gray-600 text-white' : 'bg-white border-gray-300'}`}
+          />
+          <button type="submit" className="bg-blue-600 text-white px-4 py-2 rounded-lg hover:bg-blue-700 text-sm">
+            Buscar
+          </button>
+        </form>
         <div className={`${darkMode ? 'bg-gray-800' : 'bg-white'} rounded-lg shadow-sm overflow-hidden`}>
           <div className="overflow-x-auto">
             <table className="w-full">
@@ -1081,6 +1220,13 @@ function InventoryApp() {
               </tbody>
             </table>
           </div>
+          {productsCursor && (
+            <div className="p-4 text-center">
+              <button onClick={loadMoreProducts} className="text-blue-600 hover:text-blue-700 text-sm">
+                Cargar más productos
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -1131,6 +1277,19 @@ function InventoryApp() {
           </div>
         )}
 
+        <form onSubmit={submitProductSearch} className="flex space-x-2 mb-4 md:w-1/2">
+          <input
+            name="search"
+            type="text"
+            placeholder="Buscar por nombre"
+            defaultValue={productSearch}
+            className={`flex-1 p-3 border rounded-lg ${darkMode ? 'bg-gray-700 border-gray-600 text-white' : 'bg-white border-gray-300'}`}
+          />
+          <button type="submit" className="bg-blue-600 text-white px-4 py-2 rounded-lg hover:bg-blue-700 text-sm">
+            Buscar
+          </button>
+        </form>
+
         {/* Movement Form */}
         <div className={`${darkMode ? 'bg-gray-800' : 'bg-white'} p-6 rounded-lg shadow-sm mb-8`}>
           <h3 className={`text-lg font-medium mb-4 ${darkMode ? 'text-white' : 'text-gray-900'}`}>
@@ -1144,6 +1303,11 @@ function InventoryApp() {
               required
             >
               <option value="">Seleccionar producto</option>
+              {selectedProduct && !products.some(product => product.id === selectedProduct.id) && (
+                <option value={selectedProduct.id}>
+                  {selectedProduct.name} - {selectedProduct.barcode}
+                </option>
+              )}
               {products.map((product) => (
                 <option key={product.id} value={product.id}>
                   {product.name} - {product.barcode}
@@ -1214,7 +1378,7 @@ function InventoryApp() {
               </thead>
               <tbody className="divide-y divide-gray-200">
                 {movements.map((movement) => {
-                  const product = products.find(p => p.id === movement.product_id);
+                  const productName = productNames[movement.product_id];
                   return (
                     <tr key={movement.id} className={`hover:${darkMode ? 'bg-gray-700' : 'bg-gray-50'}`}>
                       <td className="px-6 py-4 text-sm">
@@ -1233,7 +1397,7 @@ function InventoryApp() {
                         </span>
                       </td>
                       <td className={`px-6 py-4 ${darkMode ? 'text-white' : 'text-gray-900'}`}>
-                        {product ? product.name : 'Producto eliminado'}
+                        {productName === null ? 'Producto eliminado' : productName}
                       </td>
                       <td className="px-6 py-4 text-sm">
                         <div>{movement.quantity_pallets} pallets</div>
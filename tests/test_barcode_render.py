@@ -0,0 +1,132 @@
+import re
+import struct
+import zlib
+
+import pytest
+
+import barcode_render
+
+
+# Left half of 4006381333931: first digit 4 selects L G L L G G parity
+EAN13_4006381333931 = (
+    "101"
+    + "0001101" + "0100111" + "0101111" + "0111101" + "0001001" + "0110011"
+    + "01010"
+    + "1000010" + "1000010" + "1000010" + "1110100" + "1000010" + "1100110"
+    + "101"
+)
+
+
+def test_gtin_check_digit():
+    assert barcode_render.gtin_check_digit("400638133393") == "1"
+    assert barcode_render.gtin_check_digit("03600029145") == "2"
+    assert barcode_render.gtin_check_digit("200000000001") == "5"
+    assert barcode_render.gtin_check_digit("000000000000") == "0"
+
+
+def test_encode_ean13_known_code():
+    assert barcode_render.encode_ean13("4006381333931") == EAN13_4006381333931
+
+
+@pytest.mark.parametrize("code", ["4006381333932", "400638133393", "40063813339a1"])
+def test_encode_ean13_rejects_invalid_codes(code):
+    with pytest.raises(ValueError):
+        barcode_render.encode_ean13(code)
+
+
+def test_encode_upc_is_ean13_with_leading_zero():
+    modules = barcode_render.encode_upc("036000291452")
+    assert len(modules) == 95
+    assert modules == barcode_render.encode_ean13("0036000291452")
+
+
+def test_code128_values_switch_to_code_set_c_for_digit_runs():
+    # Start B, "INV", switch to C, five digit pairs, checksum, stop
+    assert barcode_render.code128_values("INV0000000001") == [104, 41, 46, 54, 99, 0, 0, 0, 0, 1, 83, 106]
+
+
+def test_code128_values_odd_digit_run_starts_in_code_set_b():
+    assert barcode_render.code128_values("12345") == [104, 17, 99, 23, 45, 53, 106]
+
+
+def test_code128_values_short_digit_runs_stay_in_code_set_b():
+    assert barcode_render.code128_values("A12") == [104, 33, 17, 18, (104 + 33 + 17 * 2 + 18 * 3) % 103, 106]
+
+
+def test_code128_rejects_non_printable_and_empty_input():
+    with pytest.raises(ValueError):
+        barcode_render.code128_values("")
+    with pytest.raises(ValueError):
+        barcode_render.code128_values("ñ")
+
+
+def test_encode_code128_known_code():
+    modules = barcode_render.encode_code128("INV0000000001")
+    assert modules.startswith("11010010000")  # Start B
+    assert modules.endswith("1100011101011")  # Stop
+    assert len(modules) == 11 * 11 + 13
+
+
+def test_code128_width_table():
+    widths = barcode_render.CODE128_WIDTHS
+    assert len(widths) == 107
+    assert len(set(widths)) == 107
+    assert all(sum(map(int, pattern)) == 11 for pattern in widths[:106])
+    assert sum(map(int, widths[106])) == 13
+
+
+@pytest.mark.parametrize("code, symbology", [
+    ("4006381333931", "EAN13"),
+    ("036000291452", "UPC"),
+    ("4006381333932", "CODE128"),
+    ("INV0000000001", "CODE128"),
+    ("12345", "CODE128"),
+])
+def test_detect_symbology(code, symbology):
+    assert barcode_render.detect_symbology(code) == symbology
+
+
+def test_bar_runs():
+    assert barcode_render.bar_runs("0110100111") == [(1, 2), (4, 1), (7, 3)]
+
+
+def test_render_svg_draws_one_path_segment_per_bar():
+    svg = barcode_render.render_svg("INV<&>", "CODE128", module_width=1).decode()
+    bars = barcode_render.bar_runs(barcode_render.encode("INV<&>", "CODE128"))
+    assert svg.startswith("<svg")
+    assert len(re.findall(r"M\d+ 0h\d+v\d+h-\d+z", svg)) == len(bars)
+    assert "INV&lt;&amp;&gt;" in svg
+
+
+def test_render_png_rows_match_modules():
+    png = barcode_render.render_png("4006381333931", "EAN13", module_width=2, height=5)
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    width, height = struct.unpack(">II", png[16:24])
+    modules = "0" * barcode_render.QUIET_ZONE + EAN13_4006381333931 + "0" * barcode_render.QUIET_ZONE
+    assert (width, height) == (len(modules) * 2, 5)
+
+    idat = png.index(b"IDAT")
+    length = struct.unpack(">I", png[idat - 4:idat])[0]
+    raw = zlib.decompress(png[idat + 4:idat + 4 + length])
+    row = raw[:width + 1]
+    assert row[0] == 0  # filter type "none"
+    assert row[1:] == b"".join((b"\x00" if module == "1" else b"\xff") * 2 for module in modules)
+    assert raw == row * height
+
+
+def test_render_label_sheet_paginates_and_indexes_objects():
+    labels = [("Tornillo (caja) ñandú", "4006381333931", "EAN13")] * 30
+    pdf = barcode_render.render_label_sheet(labels, columns=3, rows=8)
+    assert pdf.startswith(b"%PDF-1.4")
+    assert b"/Count 2" in pdf
+
+    startxref = int(pdf.rsplit(b"startxref\n", 1)[1].split(b"\n", 1)[0])
+    assert pdf[startxref:].startswith(b"xref\n")
+    offsets = re.findall(rb"(\d{10}) 00000 n ", pdf[startxref:])
+    for number, offset in enumerate(offsets, start=1):
+        assert pdf[int(offset):].startswith(f"{number} 0 obj".encode())
+
+
+def test_pdf_text_escapes_and_encodes_winansi():
+    assert barcode_render.pdf_text("a(b)\\c") == "a\\(b\\)\\\\c"
+    assert barcode_render.pdf_text("ñ") == "\xf1"
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_cursor_roundtrip():
+    cursor = server.encode_cursor(["Tornillo ñ", "0b6f"])
+    assert "=" not in cursor
+    assert server.decode_cursor(cursor) == ["Tornillo ñ", "0b6f"]
+    assert server.decode_cursor(server.encode_cursor(["a", "b", "c"]), size=3) == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("cursor", [
+    server.encode_cursor(["only-one"]),
+    server.encode_cursor({"name": "a", "id": "b"}),
+    server.encode_cursor([{"$ne": None}, "x"]),
+    server.encode_cursor(["a", 1]),
+    "not a cursor!",
+    "",
+])
+def test_decode_cursor_rejects_invalid_cursors(cursor):
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_product_ids_lookup_is_capped():
+    ids = ",".join(str(index) for index in range(server.PRODUCT_PAGE_MAX_SIZE + 1))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.get_products(limit=1, cursor=None, category=None, name_prefix=None, low_stock=False,
+                                        fields=None, ids=ids, current_user={}))
+    assert error.value.status_code == 400
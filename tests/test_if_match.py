@@ -0,0 +1,22 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+@pytest.mark.parametrize("header, version", [
+    (None, None),
+    ("*", None),
+    (' * ', None),
+    ('"3"', 3),
+    ('W/"3"', 3),
+    ("7", 7),
+])
+def test_parse_if_match(header, version):
+    assert server.parse_if_match(header) == version
+
+
+def test_parse_if_match_rejects_non_numeric_versions():
+    with pytest.raises(HTTPException) as error:
+        server.parse_if_match('"abc"')
+    assert error.value.status_code == 400
@@ -0,0 +1,40 @@
+import server
+
+
+def test_query_shape_drops_values():
+    assert server.query_shape({"id": {"$in": ["a", "b"]}, "deleted": False}) == {"id": {"$in": ["?"]}, "deleted": "?"}
+    assert server.query_shape([{"$match": {"name": "x"}}, {"$limit": 5}]) == [{"$match": {"name": "?"}}]
+    assert server.query_shape({"$or": []}) == {"$or": []}
+
+
+def test_histogram_render():
+    histogram = server.Histogram("request_seconds", "Request latency", ("route",), (0.1, 1.0))
+    histogram.observe(("/b",), 5.0)
+    histogram.observe(("/a",), 0.1)
+    histogram.observe(("/a",), 0.5)
+    histogram.observe(("/a",), 2.0)
+    assert histogram.render() == [
+        "# HELP request_seconds Request latency",
+        "# TYPE request_seconds histogram",
+        'request_seconds_bucket{route="/a",le="0.1"} 1',
+        'request_seconds_bucket{route="/a",le="1.0"} 2',
+        'request_seconds_bucket{route="/a",le="+Inf"} 3',
+        'request_seconds_sum{route="/a"} 2.6',
+        'request_seconds_count{route="/a"} 3',
+        'request_seconds_bucket{route="/b",le="0.1"} 0',
+        'request_seconds_bucket{route="/b",le="1.0"} 0',
+        'request_seconds_bucket{route="/b",le="+Inf"} 1',
+        'request_seconds_sum{route="/b"} 5.0',
+        'request_seconds_count{route="/b"} 1',
+    ]
+
+
+def test_histogram_render_without_labels():
+    histogram = server.Histogram("jobs_seconds", "Job time", (), (1.0,))
+    histogram.observe((), 0.25)
+    assert histogram.render()[2:] == [
+        'jobs_seconds_bucket{le="1.0"} 1',
+        'jobs_seconds_bucket{le="+Inf"} 1',
+        "jobs_seconds_sum{} 0.25",
+        "jobs_seconds_count{} 1",
+    ]
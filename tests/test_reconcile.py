@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+class FakeSource:
+    def __init__(self, documents):
+        self.documents = list(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.documents:
+            raise StopAsyncIteration
+        return self.documents.pop(0)
+
+
+class FakeCheckpoints:
+    def __init__(self, document):
+        self.document = document
+
+    async def find_one(self, query):
+        return self.document
+
+    async def update_one(self, query, update, upsert=False):
+        self.document = {**(self.document or {}), **update["$set"]}
+
+
+class FakeMovements:
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        return FakeSource({"id": product_id} for product_id in self.product_ids)
+
+
+class FakeDb:
+    def __init__(self, checkpoint, product_ids):
+        self.reconciliation_checkpoints = FakeCheckpoints(checkpoint)
+        self.movements = FakeMovements(product_ids)
+
+
+def test_busy_products_are_checked_again_by_the_next_run(monkeypatch):
+    started = server.datetime.now(server.timezone.utc)
+    fake = FakeDb({"movements_before": started, "recheck": []}, ["a", "b"])
+    monkeypatch.setattr(server, "db", fake)
+    checked = []
+    busy = {"b"}
+
+    async def reconcile_batch(product_ids, cutoff, repair, report):
+        checked.append(list(product_ids))
+        report["busy"] += len(busy & set(product_ids))
+        return [product_id for product_id in product_ids if product_id in busy]
+
+    monkeypatch.setattr(server, "reconcile_batch", reconcile_batch)
+    report = asyncio.run(server.reconcile_stock())
+    assert report["busy"] == 1
+    assert fake.reconciliation_checkpoints.document["recheck"] == ["b"]
+
+    # "b" has no movements in the next window but is still checked, once
+    checked.clear()
+    busy.clear()
+    fake.movements.product_ids = ["b", "c"]
+    asyncio.run(server.reconcile_stock())
+    assert checked == [["b"], ["c"]]
+    assert fake.reconciliation_checkpoints.document["recheck"] == []
+
+
+def test_reconcile_endpoint_is_limited_to_admins(monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_USERNAMES", frozenset({"ops"}))
+    user = {"user_id": "u1", "username": "ops"}
+    assert asyncio.run(server.get_admin_user(user)) is user
+    with pytest.raises(server.HTTPException) as error:
+        asyncio.run(server.get_admin_user({"user_id": "u2", "username": "someone"}))
+    assert error.value.status_code == 403
@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+
+import server
+
+
+def test_bucket_start():
+    value = datetime(2026, 3, 4, 15, 30, 12, tzinfo=timezone.utc)
+    assert server.bucket_start(value, "hour") == datetime(2026, 3, 4, 15, tzinfo=timezone.utc)
+    assert server.bucket_start(value, "day") == datetime(2026, 3, 4, tzinfo=timezone.utc)
+
+
+def test_rollup_operations_only_move_the_ending_balance_forward():
+    at = datetime(2026, 3, 4, 15, 30, tzinfo=timezone.utc)
+    product = {"current_stock_pieces": 7, "current_stock_pallets": 1}
+    counts = server.rollup_counts("exit", 3, 0)
+    for operation in server.rollup_operations("p1", at, counts, product):
+        stage = operation._doc[0]["$set"]
+        assert stage["net_pieces"] == {"$add": [{"$ifNull": ["$net_pieces", 0]}, -3]}
+        assert stage["last_movement_at"] == {"$max": ["$last_movement_at", at]}
+        latest = {"$gte": [at, {"$ifNull": ["$last_movement_at", at]}]}
+        assert stage["ending_pieces"] == {"$cond": [latest, 7, "$ending_pieces"]}
+        assert stage["ending_pallets"] == {"$cond": [latest, 1, "$ending_pallets"]}
+
+
+def test_rollup_operations_without_product_keep_the_ending_balance():
+    at = datetime(2026, 3, 4, 15, 30, tzinfo=timezone.utc)
+    for operation in server.rollup_operations("p1", at, server.rollup_counts("entry", 1, 0), None):
+        assert "ending_pieces" not in operation._doc[0]["$set"]
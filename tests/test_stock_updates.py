@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+
+def test_stock_update_without_key_leaves_apply_keys_alone():
+    stage = server.stock_update(5, -1)[0]["$set"]
+    assert "applied_movements" not in stage
+    # Stamped by the server when the write runs, never moved back
+    assert stage["updated_at"] == {"$max": ["$$NOW", "$updated_at"]}
+    assert server.applied_filter("p1") == {"id": "p1"}
+
+
+def test_stock_update_with_key_appends_it_and_filter_guards_it():
+    stage = server.stock_update(5, -1, "k1")[0]["$set"]
+    assert stage["applied_movements"] == {"$concatArrays": [{"$ifNull": ["$applied_movements", []]}, ["k1"]]}
+    assert server.applied_filter("p1", "k1") == {"id": "p1", "applied_movements": {"$ne": "k1"}}
+
+
+def test_rollup_operations_guard_buckets_by_key():
+    at = datetime(2026, 3, 4, 15, 30, tzinfo=timezone.utc)
+    operations = server.rollup_operations("p1", at, {"movements": 1}, None, "k1")
+    assert len(operations) == len(server.ROLLUP_GRANULARITIES)
+    for operation in operations:
+        assert operation._filter["applied_movements"] == {"$ne": "k1"}
+        assert operation._upsert
+
+
+def test_check_hold_stops_half_a_grace_period_early():
+    grace = timedelta(seconds=server.PENDING_MOVEMENT_GRACE_SECONDS)
+    server.check_hold(datetime.now(timezone.utc) + grace)
+    with pytest.raises(server.MovementHandedOver):
+        server.check_hold(datetime.now(timezone.utc) + grace / 4)
@@ -0,0 +1,97 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.documents.sort(key=lambda document: document[key], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class FakeCollection:
+    """Just enough of a collection for changes_since()'s keyset query."""
+
+    def __init__(self, field):
+        self.field = field
+        self.documents = []
+
+    def find(self, query, projection):
+        field = self.field
+
+        def matches(document):
+            if not document[field] < query[field]["$lt"]:
+                return False
+            after, same = query["$or"]
+            return document[field] > after[field]["$gt"] or (
+                document[field] == same[field] and document["id"] > same["id"]["$gt"])
+
+        return FakeCursor([dict(document) for document in self.documents if matches(document)])
+
+
+class FakeRequest:
+    headers = {}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    current = [datetime(2026, 5, 1, 12, 0, tzinfo=timezone.utc)]
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return current[0]
+
+    monkeypatch.setattr(server, "datetime", FrozenDatetime)
+    return current
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    collections = {"products": FakeCollection("updated_at"), "product_tombstones": FakeCollection("deleted_at")}
+    monkeypatch.setattr(server, "db", collections)
+    return collections
+
+
+def sync(token=None):
+    response = asyncio.run(server.sync_products(FakeRequest(), token=token, limit=100, current_user={}))
+    return json.loads(response.body)
+
+
+def product(product_id, updated_at):
+    return {"id": product_id, "name": product_id, "updated_at": updated_at}
+
+
+def test_write_stamped_before_it_commits_reaches_the_next_sync(clock, collections):
+    start = clock[0]
+    collections["products"].documents.append(product("a", start - timedelta(minutes=1)))
+    page = sync()
+    assert [item["id"] for item in page["items"]] == ["a"]
+
+    # A write stamped 3 s ago that only becomes visible now, after the first sync
+    collections["products"].documents.append(product("b", start - timedelta(seconds=3)))
+    clock[0] = start + timedelta(seconds=1)
+    page = sync(page["next_token"])
+    assert page["items"] == []
+
+    clock[0] = start + timedelta(seconds=server.SYNC_SETTLE_SECONDS)
+    page = sync(page["next_token"])
+    assert [item["id"] for item in page["items"]] == ["b"]
+
+    clock[0] = start + timedelta(minutes=1)
+    assert sync(page["next_token"])["items"] == []
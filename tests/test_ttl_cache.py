@@ -0,0 +1,47 @@
+import server
+
+
+def test_ttl_cache_hits_and_misses():
+    cache = server.TTLCache(maxsize=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_ttl_cache_expires_entries():
+    cache = server.TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=-1)
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = server.TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_disabled_with_zero_size():
+    cache = server.TTLCache(maxsize=0, ttl=60)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_cache_pop_clear_and_stats():
+    cache = server.TTLCache(maxsize=5, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    cache.clear()
+    assert cache.stats() == {
+        "size": 0, "maxsize": 5, "ttl": 30, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0
+    }